@@ -5,7 +5,6 @@ logging.getLogger("llama_index").setLevel(logging.WARNING)
 logging.getLogger("openai").setLevel(logging.WARNING)
 logging.getLogger("openai._base_client").setLevel(logging.WARNING)
 from dotenv import load_dotenv
-from llama_index.llms.openai import OpenAI
 from llama_index.core import Settings
 
 load_dotenv()
@@ -15,12 +14,32 @@ try:
 except Exception:
     from llama_index.core.agent import ReActAgent
 
-from agent_tools import TOOLS
+from agent_tools import NAO_MEMOIZAVEIS, TOOLS
+import agent_runtime
+import llm_scheduler
+import tool_retrieval
 
+# Quantas ferramentas (além das fixas) vão para o prompt a cada pergunta. 0 = todas.
+TOOL_TOP_K = int(os.getenv("AGENT_TOOL_TOP_K", "8"))
+
+
+def _ferramentas_agente() -> dict:
+    """Todas as tools, ou só as fixas + um retriever que escolhe as top-k por pergunta."""
+    tools = agent_runtime.memoizar(TOOLS, nao_memoizar=NAO_MEMOIZAVEIS)
+    if TOOL_TOP_K <= 0 or not tool_retrieval.suportado():
+        return {"tools": tools}
+
+    indice = tool_retrieval.IndiceFerramentas(tools)
+    return {
+        "tools": indice.fixas,
+        "tool_retriever": tool_retrieval.RetrieverFerramentas(indice, top_k=TOOL_TOP_K),
+    }
 
 
 def get_agent():
-    Settings.llm = OpenAI(
+    # chamadas ao LLM passam pelo agendador compartilhado (pool HTTP, rate limit, fila justa);
+    # o cliente OpenAI só é importado aqui, quando o agente é criado
+    Settings.llm = llm_scheduler.criar_llm(
         model="gpt-4o-mini",
         api_key=os.getenv("OPENAI_API_KEY"),
         temperature=0.1,
@@ -33,16 +52,23 @@ Regras:
 - Seja objetivo e claro, em português.
 - Se o usuário perguntar qual ferramenta foi utilizada, você DEVE informar o nome exato da função que chamou (ex: tool_produtos_mais_vendidos).
 - Use ferramentas específicas para cálculos comuns.
+- As ferramentas específicas aceitam filtros opcionais (data_inicio, data_fim, locais, produtos, tipos_promocao): use-os para perguntas recortadas (ex: "top produtos no local X em março") em vez de 'consulta_geral'.
+- Para somas/médias por produto, local, mês, dia ou promoção (com filtros), use 'consulta_metricas'.
+- Se a ferramenta 'consulta_sql' estiver disponível, prefira-a à 'consulta_geral' para cruzamentos não previstos (escreva o SQL você mesmo).
 - Se a pergunta for complexa ou envolver cruzamentos de dados não previstos, use a ferramenta 'consulta_geral'.
 - Você tem acesso total aos dados do arquivo sales_clean.csv através dessas ferramentas.
 - Não invente números.
+- Para perguntas exploratórias em datasets grandes, 'resumo_aproximado' e o parâmetro aproximado=True respondem na hora; informe a margem de erro retornada. Quando o usuário pedir o número exato, não use o modo aproximado.
+- Quando uma resposta anterior trouxer resultado_id, use as ferramentas resultado_* para filtrar/ordenar/agregar esse resultado em vez de recalcular.
+- Se o usuário quiser o resultado completo em arquivo (CSV/Parquet), use 'exportar_resultado' e informe o caminho, as linhas e o tamanho retornados.
+- As ferramentas disponíveis variam conforme a pergunta; se nenhuma específica servir, use 'consulta_geral'.
 - Use a ferramenta 'processar_e_limpar_vendas' se o usuário pedir para organizar ou limpar a base.
 - Use a 'consulta_geral' para cálculos e perguntas sobre o conteúdo.
 - Sempre confirme quando uma limpeza for realizada com sucesso.
 """.strip()
 
     agent = ReActAgent(
-        tools=TOOLS,
+        **_ferramentas_agente(),
         llm=Settings.llm,
         system_prompt=system_prompt,
     )
@@ -0,0 +1,207 @@
+import asyncio
+import contextvars
+import json
+import os
+import time
+
+from llama_index.core.agent.workflow import ToolCallResult
+from llama_index.core.llms import ChatMessage
+from llama_index.core.tools import FunctionTool
+
+from llm_usage import iniciar_contagem
+from sessao import dataset_atual
+from tool_memory import iniciar_registro
+
+# =========================
+# Execução de uma pergunta com orçamento e detecção de loop
+# =========================
+# - Chamadas repetidas (mesma tool + mesmos argumentos) na mesma pergunta são servidas
+#   do memo do turno, sem reexecutar a tool. Tools cujo resultado depende do estado da
+#   sessão (resultados guardados, dataset em uso, exportações) ficam fora do memo.
+# - Orçamento por pergunta: tempo, tokens e nº de chamadas de tools.
+# - Se o orçamento estourar ou o agente repetir chamadas seguidas (sem progresso),
+#   a execução é interrompida e uma resposta final é gerada com o que já foi obtido.
+
+ORCAMENTO_PADRAO = {
+    "max_iterations": int(os.getenv("AGENT_MAX_ITERATIONS", "60")),
+    "tempo_max_s": float(os.getenv("AGENT_TEMPO_MAX_S", "120")),
+    "tokens_max": int(os.getenv("AGENT_TOKENS_MAX", "80000")),
+    "max_chamadas": int(os.getenv("AGENT_MAX_CHAMADAS_TOOLS", "15")),
+    "max_repeticoes": int(os.getenv("AGENT_MAX_REPETICOES", "2")),
+}
+
+_TURNO = contextvars.ContextVar("turno_agente", default=None)
+
+# limite de texto de cada resultado de tool usado na resposta forçada
+_MAX_CHARS_RESULTADO = 4000
+
+
+class EstadoTurno:
+    def __init__(self):
+        self.memo: dict = {}
+        self.chamadas = 0
+        self.repeticoes = 0
+        self.repeticoes_seguidas = 0
+        self.resultados: list = []
+
+    def registrar(self, nome: str, kwargs: dict, repetida: bool):
+        self.chamadas += 1
+        if repetida:
+            self.repeticoes += 1
+            self.repeticoes_seguidas += 1
+        else:
+            self.repeticoes_seguidas = 0
+
+
+def _chave(nome: str, kwargs: dict) -> str:
+    # o dataset da sessão entra na chave: trocar de dataset no meio da pergunta não reaproveita
+    return f"{dataset_atual()}:{nome}:" + json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _aviso_repeticao(resultado) -> str:
+    return (
+        "(Chamada repetida com os mesmos argumentos nesta pergunta; resultado reaproveitado. "
+        f"Use-o para responder.)\n{resultado}"
+    )
+
+
+def memoizar(tools: list, nao_memoizar=frozenset()) -> list:
+    """
+    Envolve cada tool com o memo do turno (por nome + argumentos). As tools em
+    `nao_memoizar` (com estado) sempre executam, mas contam no orçamento de chamadas.
+    """
+    saida = []
+    for tool in tools:
+        nome = tool.metadata.name
+        memo = nome not in nao_memoizar
+
+        def _sync(*args, _fn=tool.fn, _nome=nome, _memo=memo, **kwargs):
+            estado = _TURNO.get()
+            if estado is None or args:
+                return _fn(*args, **kwargs)
+            chave = _chave(_nome, kwargs) if _memo else None
+            if chave in estado.memo:
+                estado.registrar(_nome, kwargs, repetida=True)
+                return _aviso_repeticao(estado.memo[chave])
+            resultado = _fn(**kwargs)
+            if _memo:
+                estado.memo[chave] = resultado
+            estado.registrar(_nome, kwargs, repetida=False)
+            return resultado
+
+        async def _async(*args, _fn=tool.async_fn, _nome=nome, _memo=memo, **kwargs):
+            estado = _TURNO.get()
+            if estado is None or args:
+                return await _fn(*args, **kwargs)
+            chave = _chave(_nome, kwargs) if _memo else None
+            if chave in estado.memo:
+                estado.registrar(_nome, kwargs, repetida=True)
+                return _aviso_repeticao(estado.memo[chave])
+            resultado = await _fn(**kwargs)
+            if _memo:
+                estado.memo[chave] = resultado
+            estado.registrar(_nome, kwargs, repetida=False)
+            return resultado
+
+        saida.append(
+            FunctionTool.from_defaults(
+                fn=_sync,
+                async_fn=_async,
+                name=nome,
+                description=tool.metadata.description,
+                fn_schema=tool.metadata.fn_schema,
+            )
+        )
+    return saida
+
+
+def _motivo_parada(estado: EstadoTurno, uso, orcamento: dict) -> str | None:
+    if uso.tokens_total >= orcamento["tokens_max"]:
+        return "orçamento de tokens"
+    if estado.repeticoes_seguidas >= orcamento["max_repeticoes"]:
+        return "chamadas repetidas"
+    if estado.chamadas >= orcamento["max_chamadas"]:
+        return "limite de chamadas de ferramentas"
+    return None
+
+
+async def _forcar_resposta(agent, pergunta: str, estado: EstadoTurno, motivo: str) -> str:
+    """Uma única chamada ao LLM para responder só com os resultados já obtidos."""
+    if not estado.resultados:
+        return f"Não foi possível concluir a análise ({motivo}) antes de obter resultados das ferramentas."
+
+    blocos = [
+        f"[{r['ferramenta']}({json.dumps(r['argumentos'], ensure_ascii=False, default=str)})]\n"
+        f"{r['resultado'][:_MAX_CHARS_RESULTADO]}"
+        for r in estado.resultados
+    ]
+    mensagens = [
+        ChatMessage(
+            role="system",
+            content=(
+                "Você é um Analista de IA Sênior especializado em vendas. Responda em português, de forma "
+                "objetiva, usando APENAS os resultados de ferramentas fornecidos. Não invente números. "
+                "Se os resultados não bastarem, diga o que faltou."
+            ),
+        ),
+        ChatMessage(role="user", content=f"Pergunta: {pergunta}\n\nResultados obtidos:\n\n" + "\n\n".join(blocos)),
+    ]
+    resposta = await agent.llm.achat(mensagens)
+    return str(resposta.message.content or "")
+
+
+async def executar_pergunta(agent, pergunta: str, ctx, orcamento: dict | None = None) -> dict:
+    """
+    Roda a pergunta no agente respeitando o orçamento. Retorna resposta, ferramentas
+    usadas, motivo de parada antecipada (ou None), uso de tokens e os registros de
+    memória das tools (com TOOL_MEM_PROFILE=1, ou quando alguma foi degradada/rejeitada).
+    """
+    orcamento = {**ORCAMENTO_PADRAO, **(orcamento or {})}
+    estado = EstadoTurno()
+    _TURNO.set(estado)
+    uso = iniciar_contagem()
+    memoria = iniciar_registro()
+
+    handler = agent.run(
+        pergunta,
+        ctx=ctx,
+        max_iterations=orcamento["max_iterations"],
+        early_stopping_method="generate",
+    )
+
+    motivo = None
+    resposta = None
+    inicio = time.perf_counter()
+    try:
+        async with asyncio.timeout(orcamento["tempo_max_s"]):
+            async for ev in handler.stream_events():
+                if isinstance(ev, ToolCallResult):
+                    estado.resultados.append({
+                        "ferramenta": ev.tool_name,
+                        "argumentos": ev.tool_kwargs,
+                        "resultado": str(ev.tool_output.content),
+                    })
+                motivo = _motivo_parada(estado, uso, orcamento)
+                if motivo:
+                    break
+            if motivo is None:
+                resposta = str(await handler)
+    except TimeoutError:
+        motivo = "tempo máximo"
+
+    if motivo:
+        try:
+            await handler.cancel_run()
+        except Exception:
+            pass
+        resposta = await _forcar_resposta(agent, pergunta, estado, motivo)
+
+    return {
+        "resposta": resposta,
+        "ferramentas": [r["ferramenta"] for r in estado.resultados],
+        "chamadas_repetidas": estado.repeticoes,
+        "parada_antecipada": motivo,
+        "duracao_s": round(time.perf_counter() - inicio, 3),
+        **uso.to_dict(),
+        "memoria_ferramentas": memoria,
+    }
@@ -1,90 +1,477 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import os
+
 from llama_index.core.tools import FunctionTool
-from llama_index.experimental.query_engine import PandasQueryEngine
+import numpy as np
+import pandas as pd
 import analytics as t
+import metric_query as mq
+import parallel
+import sql_engine
+import result_store as rs
+import datasets
+from sessao import dataset_atual, selecionar_dataset
+import sketches as sk
+import export
+import tool_memory as tm
+
+# =========================
+# Filtros globais (período, locais, produtos, tipos de promoção)
+# =========================
+# Toda tool determinística decorada com @com_filtros ganha os parâmetros abaixo.
+# O filtro vale durante a chamada (contextvar) e é resolvido pelos índices
+# pré-calculados em analytics.construir_indice_filtros; _dados() devolve o recorte.
+_FILTRO_ATUAL = contextvars.ContextVar("filtro_atual", default=None)
+
+_PARAMS_FILTRO = [
+    inspect.Parameter("data_inicio", inspect.Parameter.KEYWORD_ONLY, default=None, annotation=str | None),
+    inspect.Parameter("data_fim", inspect.Parameter.KEYWORD_ONLY, default=None, annotation=str | None),
+    inspect.Parameter("locais", inspect.Parameter.KEYWORD_ONLY, default=None, annotation=list[str] | None),
+    inspect.Parameter("produtos", inspect.Parameter.KEYWORD_ONLY, default=None, annotation=list[str] | None),
+    inspect.Parameter("tipos_promocao", inspect.Parameter.KEYWORD_ONLY, default=None, annotation=list[str] | None),
+]
+
+
+def com_filtros(fn):
+    """Adiciona os filtros globais opcionais à assinatura (e ao schema) da tool."""
+    assinatura = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, data_inicio=None, data_fim=None, locais=None, produtos=None, tipos_promocao=None, **kwargs):
+        filtro = {
+            "data_inicio": data_inicio, "data_fim": data_fim,
+            "locais": locais, "produtos": produtos, "tipos_promocao": tipos_promocao,
+        }
+        for campo in ("data_inicio", "data_fim"):
+            if filtro[campo]:
+                try:
+                    pd.to_datetime(filtro[campo])
+                except (ValueError, TypeError, OverflowError):
+                    return f"Erro: {campo} inválida ('{filtro[campo]}'). Use o formato YYYY-MM-DD."
+        token = _FILTRO_ATUAL.set(filtro if any(filtro.values()) else None)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _FILTRO_ATUAL.reset(token)
+
+    wrapper.__signature__ = assinatura.replace(parameters=[*assinatura.parameters.values(), *_PARAMS_FILTRO])
+    wrapper.__doc__ = (fn.__doc__ or "").rstrip() + (
+        "\n    Filtros opcionais: data_inicio/data_fim (YYYY-MM-DD), locais, produtos,"
+        " tipos_promocao ('Sem Promo' = sem promoção).\n"
+    )
+    return wrapper
+
+
+def _filtro_ativo() -> bool:
+    return _FILTRO_ATUAL.get() is not None
+
+
+def _recorte() -> tuple:
+    """(df ativo, posições das linhas do filtro da chamada ou None se não há filtro)."""
+    dados, versao = t.snapshot()
+    filtro = _FILTRO_ATUAL.get()
+    if not filtro:
+        return dados, None
+    indice = t.cache_por_versao("indice_filtros", t.construir_indice_filtros, (dados, versao))
+    mask = t.mascara_filtros(indice, **filtro)
+    return dados, (np.flatnonzero(mask) if mask is not None else None)
+
+
+def _dados() -> pd.DataFrame:
+    """
+    Dataset ativo, já recortado pelo filtro da chamada (se houver). Sem filtro, é o próprio
+    df ativo, sem cópia: as funções de analytics não alteram o DataFrame recebido.
+    Se o recorte passar do orçamento de memória, vira uma amostra (ou a chamada é rejeitada).
+    """
+    dados, posicoes = _recorte()
+    n = len(posicoes) if posicoes is not None else len(dados)
+    bytes_linha = t.cache_por_versao("bytes_por_linha", tm.bytes_por_linha, t.snapshot())
+    fracao = tm.limitar_linhas(n, bytes_linha)
+    if fracao is not None:
+        linhas = posicoes if posicoes is not None else np.arange(len(dados))
+        out = dados.iloc[tm.amostrar(linhas, fracao)]
+    elif posicoes is not None:
+        out = dados.iloc[posicoes]
+    else:
+        out = dados
+
+    tm.registrar_intermediario(out)
+    return out
+
+
+def _exigir_orcamento(nome: str | None = None):
+    """
+    Derivados em cache e o caminho paralelo leem o dataset inteiro e não podem ser
+    amostrados: se ainda não estão calculados, a construção precisa caber no orçamento.
+    nome=None: leitura do dataset inteiro sem cache (consultas livres), sempre verificada.
+    """
+    snap = t.snapshot()
+    if nome is None or not t.em_cache(nome, snap):
+        bytes_linha = t.cache_por_versao("bytes_por_linha", tm.bytes_por_linha, snap)
+        tm.limitar_linhas(len(snap[0]), bytes_linha, amostravel=False)
+
+
+def _derivado(nome: str, builder):
+    """Derivado em cache por versão; com filtro ativo, calcula sobre o recorte."""
+    if _filtro_ativo():
+        return builder(_dados())
+    _exigir_orcamento(nome)
+    return t.cache_por_versao(nome, builder)
+
+
+def _sketches() -> dict:
+    """Sketches do dataset ativo (construídos uma vez por versão, no ingest)."""
+    _exigir_orcamento("sketches")
+    return t.cache_por_versao("sketches", sk.construir_sketches)
+
 
-query_engine = PandasQueryEngine(df=t.df, verbose=False)
+# MODO_APROXIMADO=1: constrói os sketches já na carga (e a cada recarga, via pré-aquecimento)
+if os.getenv("MODO_APROXIMADO", "0") == "1":
+    _sketches()
+
+
+def _rollups() -> dict:
+    """Rollups de calendário (dia/semana/mês/ano; total, por produto e por local)."""
+    return _derivado("rollups_calendario", t.construir_rollups)
+
+
+# rollups são montados no primeiro uso (ROLLUPS_NA_CARGA=1 monta já na carga)
+if os.getenv("ROLLUPS_NA_CARGA", "0") == "1":
+    _rollups()
+
+
+def _get_query_engine():
+    """
+    PandasQueryEngine (llama_index.experimental) só é carregado na primeira consulta_geral,
+    e é recriado quando o dataset é recarregado (um por versão).
+    """
+    from llama_index.experimental.query_engine import PandasQueryEngine
+
+    return t.cache_por_versao("pandas_query_engine", lambda df: PandasQueryEngine(df=df, verbose=False))
 
 def tool_consulta_geral(pergunta: str) -> str:
     """
     Útil para perguntas complexas sobre o dataset que não possuem ferramentas específicas.
     Passe a pergunta completa em português.
     """
-    
-    resposta = query_engine.query(pergunta)
+    _exigir_orcamento()  # o código gerado roda sobre o dataset inteiro
+    resposta = _get_query_engine().query(pergunta)
     print("[Texto gerado apartir de pandasQueries]")
     return str(resposta)
 
+def tool_consulta_sql(sql: str) -> str:
+    """
+    Executa uma consulta SQL (somente SELECT/WITH, dialeto DuckDB) na tabela `sales`.
+    Colunas: product_id, local, date, planned_quantity, actual_quantity, actual_price,
+    service_level, promotion_type (NULL = sem promoção).
+    Receita = actual_quantity * actual_price. Retorna no máximo 200 linhas.
+    """
+    if not sql_engine.usa_parquet(t.snapshot()[1]):
+        _exigir_orcamento()  # sem Parquet, o DuckDB varre o DataFrame inteiro em memória
+    try:
+        out = sql_engine.executar_sql(sql)
+    except Exception as e:
+        return f"Erro ao executar SQL: {e}"
+    if out.empty:
+        return "Consulta sem resultados."
+    print("[Texto gerado apartir de consulta SQL]")
+    return rs.renderizar(out, f"consulta_sql: {sql}", n=len(out))
+
+
+@com_filtros
+def tool_consulta_metricas(
+    dimensoes: list[str] | None = None,
+    medidas: list[str] | None = None,
+    ordenar_por: str | None = None,
+    ascendente: bool = False,
+    top_k: int | None = 20,
+) -> str:
+    """
+    Consulta estruturada (rápida, sem gerar código): soma/média de medidas por dimensões.
+    dimensoes: product_id, local, mes, dia, promo_flag, promotion_type.
+    medidas: volume, volume_planejado, receita, gap, mape, nivel_servico, preco_medio, linhas, produtos_distintos.
+    Use antes de 'consulta_geral' para cortes simples.
+    """
+    try:
+        out = mq.consultar_metricas(
+            _dados(),  # recorte pelos filtros comuns (índices compartilhados) e orçamento
+            dimensoes=dimensoes,
+            medidas=medidas,
+            ordenar_por=ordenar_por,
+            ascendente=ascendente,
+            top_k=top_k,
+        )
+    except (ValueError, KeyError) as e:
+        return f"Erro na consulta: {e}"
+    if out.empty:
+        return "Nenhuma linha atende aos filtros."
+    return rs.renderizar(out, "consulta_metricas", n=len(out))
+
 # =========================
 # 1) Desempenho de vendas e acurácia de planejamento
 # =========================
+@com_filtros
 def tool_calcular_acuracia_planejamento() -> str:
     """
     Calcula o desvio percentual (pct_desvio) entre planned_quantity e actual_quantity
     e retorna colunas-chave para análise.
     """
-    df_out = t.calcular_acuracia_planejamento(t.df.copy())
-    return df_out.head(20).to_string(index=False)
+    df_out = t.calcular_acuracia_planejamento(_dados())
+    return rs.renderizar(df_out, "calcular_acuracia_planejamento", n=20)
 
 
+@com_filtros
 def tool_identificar_ruptura_ou_excesso(threshold: float = 0.2) -> str:
     """
     Identifica linhas em que actual_quantity diverge muito de planned_quantity.
     threshold=0.2 significa ±20%.
     """
-    alertas = t.identificar_ruptura_ou_excesso(t.df.copy(), threshold=threshold)
+    alertas = t.identificar_ruptura_ou_excesso(_dados(), threshold=threshold)
     if alertas.empty:
         return f"Nenhum alerta encontrado com threshold={threshold:.2f}."
-    return alertas.head(50).to_string(index=False)
+    return rs.renderizar(alertas, f"identificar_ruptura_ou_excesso(threshold={threshold})", n=50)
+
+
+@com_filtros
+def tool_anomalias_ruptura_excesso(
+    tipo: str | None = None,
+    nivel: str | None = None,
+    product_id: str | None = None,
+    local: str | None = None,
+    min_dias: int = 1,
+    top_n: int = 20,
+) -> str:
+    """
+    Episódios de ruptura/excesso detectados por série (product_id, local), com baseline
+    móvel e z-score, ordenados por severidade.
+    tipo: 'ruptura' ou 'excesso'. nivel: 'alta', 'media' ou 'baixa'.
+    min_dias: duração mínima do desvio persistente.
+    """
+    anomalias = _derivado("anomalias", t.detectar_anomalias_series)
+    out = t.consultar_anomalias(
+        anomalias, tipo=tipo, nivel=nivel, product_id=product_id, local=local,
+        min_dias=min_dias, top_n=top_n,
+    )
+    if out.empty:
+        return "Nenhum episódio de ruptura/excesso encontrado com esses critérios."
+    return out.to_string(index=False)
 
 
 # =========================
 # 2) Impacto de promoções por produto
 # =========================
+@com_filtros
 def tool_impacto_promocao_por_produto() -> str:
     """
     Compara médias de volume, preço e nível de serviço por product_id e promotion_type.
     """
-    analise = t.impacto_promocao_por_produto(t.df.copy())
+    analise = t.impacto_promocao_por_produto(_dados())
     if analise.empty:
         return "Sem dados para analisar impacto de promoção por produto."
-    return analise.head(50).to_string(index=False)
+    return rs.renderizar(analise, "impacto_promocao_por_produto", n=50)
+
+
+@com_filtros
+def tool_elasticidade_preco(product_id: str | None = None, top_n: int = 20, mais_elasticos: bool = True) -> str:
+    """
+    Elasticidade-preço por produto (regressão log-quantidade vs log-preço com indicador
+    de promoção). elasticidade < -1 = demanda elástica. efeito_promo_% = ganho de volume
+    da promoção a preço constante. Informe product_id para um produto específico.
+    """
+    tabela = _derivado("elasticidade", t.estimar_elasticidade_preco)
+    if product_id:
+        out = tabela[tabela["product_id"].astype(str) == str(product_id)]
+        if out.empty:
+            return f"Produto {product_id} não encontrado (ou sem preço/quantidade válidos)."
+        return out.to_string(index=False)
+
+    out = tabela.dropna(subset=["elasticidade"])
+    out = out if mais_elasticos else out.iloc[::-1]
+    return out.head(top_n).to_string(index=False)
+
+
+@com_filtros
+def tool_previsao_demanda(
+    product_id: str | None = None,
+    local: str | None = None,
+    resumo: bool = False,
+    top_n: int = 20,
+) -> str:
+    """
+    Previsão de demanda diária (próximos 14 dias) para cada série product_id + local,
+    com o melhor modelo da série (naive sazonal, média móvel 7/28 ou suavização exponencial).
+    Sem product_id/local: séries em que a previsão mais supera o planejado (ganho_pp =
+    MAPE do plano - MAPE do modelo, nos últimos 28 dias). resumo=True: desempenho por modelo.
+    """
+    prev = _derivado("previsao_demanda", t.prever_demanda_lote)
+    if prev["series"].empty:
+        return "Sem dados para prever demanda."
+    if resumo:
+        return prev["modelos"].to_string(index=False)
+    if not product_id and not local:
+        return rs.renderizar(prev["series"], "previsao_demanda: avaliação por série", n=top_n)
+
+    out = prev["previsoes"]
+    mask = pd.Series(True, index=out.index)
+    if product_id:
+        mask &= out["product_id"].astype(str) == str(product_id)
+    if local:
+        mask &= out["local"].astype(str) == str(local)
+    out = out[mask]
+    if out.empty:
+        return "Série não encontrada para esse product_id/local."
+    return rs.renderizar(out, f"previsao_demanda(product_id={product_id}, local={local})", n=top_n)
 
 
 # =========================
 # 3) Ranking e Curva ABC (Pareto)
 # =========================
+@com_filtros
 def tool_ranking_receita_por_local() -> str:
     """
     Ranking de receita real (actual_quantity * actual_price) por local.
     """
-    ranking = t.ranking_receita_por_local(t.df.copy())
+    if parallel.habilitado() and not _filtro_ativo():
+        _exigir_orcamento("particoes_por_local")
+        ranking = parallel.ranking_receita_por_local()
+    else:
+        ranking = t.ranking_receita_por_local(_dados())
     return ranking.head(20).to_string()
 
 
+@com_filtros
 def tool_produtos_mais_vendidos(top_n: int = 10) -> str:
     """
     Retorna os top N produtos por volume total vendido (actual_quantity).
     """
-    top = t.produtos_mais_vendidos(t.df.copy(), top_n=top_n)
+    top = t.produtos_mais_vendidos(_dados(), top_n=top_n)
     return top.to_string()
 
 
+def _tabela_abc(nivel: str, metrica: str):
+    return _derivado(
+        f"abc_{nivel}_{metrica}",
+        lambda df: t.classificar_abc(df, nivel=nivel, metrica=metrica),
+    )
+
+
+@com_filtros
+def tool_curva_abc_resumo(nivel: str = "produto", metrica: str = "receita") -> str:
+    """
+    Resumo da curva ABC (Pareto): quantos itens e quanto da receita/volume cada classe concentra.
+    nivel: 'produto' ou 'produto_local'. metrica: 'receita' ou 'volume'.
+    """
+    try:
+        tabela = _tabela_abc(nivel, metrica)
+    except ValueError as e:
+        return f"Erro: {e}"
+    return t.resumo_abc(tabela, metrica=metrica).to_string(index=False)
+
+
+@com_filtros
+def tool_curva_abc_membros(
+    classe: str = "A",
+    nivel: str = "produto",
+    metrica: str = "receita",
+    product_id: str | None = None,
+    local: str | None = None,
+    top_n: int = 50,
+) -> str:
+    """
+    Lista os itens de uma classe da curva ABC (A, B ou C), em ordem de participação.
+    Também responde a classe de um product_id/local específico.
+    nivel: 'produto' ou 'produto_local'. metrica: 'receita' ou 'volume'.
+    """
+    try:
+        tabela = _tabela_abc(nivel, metrica)
+    except ValueError as e:
+        return f"Erro: {e}"
+
+    mask = pd.Series(True, index=tabela.index)
+    if product_id:
+        mask &= tabela["product_id"].astype(str) == str(product_id)
+    else:
+        mask &= tabela["classe"] == classe.upper()
+    if local and "local" in tabela.columns:
+        mask &= tabela["local"].astype(str) == str(local)
+
+    out = tabela[mask]
+    if out.empty:
+        return "Nenhum item encontrado para esses critérios."
+    total = int(mask.sum())
+    return f"{total} itens encontrados.\n" + out.head(top_n).to_string(index=False)
+
+
 # =========================
 # 4) Nível de serviço
 # =========================
+@com_filtros
 def tool_analisar_degradacao_servico(min_service_level: float = 0.95) -> str:
     """
     Lista transações onde service_level ficou abaixo de um mínimo.
     """
-    df_bad = t.analisar_degradacao_servico(t.df.copy(), min_service_level=min_service_level)
+    df_bad = t.analisar_degradacao_servico(_dados(), min_service_level=min_service_level)
     if df_bad.empty:
         return f"Nenhuma transação abaixo de min_service_level={min_service_level:.2f}."
-    return df_bad.head(50).to_string(index=False)
+    return rs.renderizar(df_bad, f"analisar_degradacao_servico(min_service_level={min_service_level})", n=50)
+
+
+# funções linha a linha: aplicadas bloco a bloco na exportação
+_EXPORTAVEIS = {
+    "calcular_acuracia_planejamento": lambda bloco, p: t.calcular_acuracia_planejamento(bloco),
+    "identificar_ruptura_ou_excesso": lambda bloco, p: t.identificar_ruptura_ou_excesso(bloco, threshold=p["threshold"]),
+    "analisar_degradacao_servico": lambda bloco, p: t.analisar_degradacao_servico(
+        bloco, min_service_level=p["min_service_level"]
+    ),
+}
+
+
+@com_filtros
+def tool_exportar_resultado(
+    fonte: str,
+    formato: str = "csv",
+    compressao: str | None = None,
+    threshold: float = 0.2,
+    min_service_level: float = 0.95,
+    nome_arquivo: str | None = None,
+) -> dict:
+    """
+    Exporta o resultado COMPLETO para arquivo (não só as primeiras linhas).
+    fonte: 'calcular_acuracia_planejamento', 'identificar_ruptura_ou_excesso'
+    (usa threshold), 'analisar_degradacao_servico' (usa min_service_level)
+    ou um resultado_id de uma resposta anterior.
+    formato: 'csv' (compressao None ou 'gzip') ou 'parquet' (None, 'snappy', 'gzip', 'zstd').
+    nome_arquivo: opcional, só o nome (o arquivo sempre fica na pasta de exportações).
+    Retorna caminho, linhas e tamanho do arquivo.
+    """
+    if fonte in _EXPORTAVEIS:
+        dados, posicoes = _recorte()
+        params = {"threshold": threshold, "min_service_level": min_service_level}
+        partes = (_EXPORTAVEIS[fonte](bloco, params) for bloco in export.blocos(dados, posicoes))
+    else:
+        try:
+            resultado = rs.store.obter(fonte)
+        except KeyError as e:
+            return {"erro": f"{e} Fontes válidas: {list(_EXPORTAVEIS)} ou um resultado_id."}
+        partes = export.blocos(resultado)
+
+    try:
+        return export.exportar_blocos(
+            partes, fonte, formato=formato, compressao=compressao, nome_arquivo=nome_arquivo
+        )
+    except FileExistsError:
+        return {"erro": f"Já existe um arquivo '{nome_arquivo}' na pasta de exportações; escolha outro nome."}
+    except (ValueError, RuntimeError) as e:
+        return {"erro": str(e)}
 
 
 # =========================
 # 5) Perguntas do README (helpers)
 # =========================
+@com_filtros
 def tool_top_entidades(
     group_by_col: str = "product_id",
     metric: str = "actual_quantity",
@@ -93,162 +480,372 @@ def tool_top_entidades(
     """
     Top N entidades (ex: product_id/local) pelo somatório de uma métrica.
     """
-    return t.get_top_performing_entities(t.df, group_by_col=group_by_col, metric=metric, top_n=top_n)
+    return t.get_top_performing_entities(_dados(), group_by_col=group_by_col, metric=metric, top_n=top_n)
 
 
+@com_filtros
 def tool_vendas_por_periodo(start_date: str, end_date: str) -> dict:
     """
     Total de vendas (actual_quantity) em um período.
     Datas no formato YYYY-MM-DD.
     """
-    return t.get_total_sales_period(t.df.copy(), start_date=start_date, end_date=end_date)
+    return t.get_total_sales_period(_dados(), start_date=start_date, end_date=end_date)
+
+
+@com_filtros
+def tool_vendas_por_calendario(
+    granularidade: str = "mes",
+    product_id: str | None = None,
+    local: str | None = None,
+    top_n: int = 60,
+) -> str:
+    """
+    Série de volume, planejado e receita por período: 'dia', 'semana' (ISO), 'mes' ou 'ano'.
+    Total, de um produto (product_id) ou de um local. Os períodos incluem o ano
+    (ex: '2024-03', '2024-W11'), então anos diferentes não se misturam.
+    """
+    try:
+        out = t.consultar_rollup(_rollups(), granularidade, product_id=product_id, local=local)
+    except ValueError as e:
+        return f"Erro: {e}"
+    if out.empty:
+        return "Sem vendas para esse recorte."
+    return rs.renderizar(out, f"vendas_por_calendario({granularidade})", n=top_n)
 
 
-def tool_gap_planejamento() -> dict:
+@com_filtros
+def tool_gap_planejamento(aproximado: bool = False) -> dict:
     """
     Diferença entre planejado e realizado (gap_total, mape_medio e tendência).
+    aproximado=True: resposta instantânea via sketches (MAPE por amostra, com IC 95%);
+    ignorado quando há filtros.
     """
-    return t.analyze_planning_gap(t.df.copy())
+    if aproximado and not _filtro_ativo():
+        return sk.gap_aproximado(_sketches())
+    return t.analyze_planning_gap(_dados())
 
 
 # =========================
 # 5b) Métricas extras (para evitar "chutes" do PandasQueryEngine)
 # =========================
+@com_filtros
 def tool_promocao_share() -> dict:
     """
     Retorna qual % das vendas ocorreu com promoção.
     (linhas, volume e receita)
     """
-    return t.get_promocao_share(t.df.copy())
+    return t.get_promocao_share(_dados())
 
 
+@com_filtros
 def tool_preco_medio_geral() -> dict:
     """
     Retorna o preço médio geral (actual_price).
     """
-    return t.get_preco_medio_geral(t.df.copy())
+    return t.get_preco_medio_geral(_dados())
 
 
+@com_filtros
 def tool_produto_maior_receita() -> dict:
     """
     Retorna o produto com maior receita total.
     Receita = soma(actual_quantity * actual_price) por produto.
     """
-    return t.get_produto_maior_receita(t.df.copy())
+    return t.get_produto_maior_receita(_dados())
 
 # =========================
 # 6) Elasticidade / Promoção (resumo por promotion_type)
 # =========================
-def tool_impacto_promocao() -> dict:
+@com_filtros
+def tool_impacto_promocao(aproximado: bool = False) -> dict:
     """
     Compara médias com e sem promoção por promotion_type.
+    aproximado=True: médias com/sem promoção estimadas por amostra, com IC 95%;
+    ignorado quando há filtros.
     """
-    return t.analyze_promotion_impact(t.df.copy())
+    if aproximado and not _filtro_ativo():
+        return sk.promocao_aproximada(_sketches())
+    return t.analyze_promotion_impact(_dados())
 
 
 # =========================
 # 7) Saúde Logística
 # =========================
+@com_filtros
 def tool_risco_servico(threshold: float = 0.85) -> dict:
     """
     Identifica combinações local+produto com nível de serviço médio crítico.
     """
-    return t.check_service_risk(t.df.copy(), threshold=threshold)
+    if parallel.habilitado() and not _filtro_ativo():
+        _exigir_orcamento("particoes_por_local")
+        return parallel.check_service_risk(threshold=threshold)
+    return t.check_service_risk(_dados(), threshold=threshold)
 
 # =========================
 # 8) Relatório executivo (texto + PDF)
 # =========================
+@com_filtros
 def tool_gerar_relatorio(top_n: int = 5) -> str:
     """
     Gera um relatório executivo em texto com os principais indicadores do dataset.
     """
-    return t.gerar_relatorio_executivo(t.df.copy(), top_n=top_n)
+    return t.gerar_relatorio_executivo(_dados(), top_n=top_n)
 
 
+@com_filtros
 def tool_gerar_relatorio_pdf(top_n: int = 5, output_path: str = "reports/relatorio_executivo.pdf") -> str:
     """
     Gera o relatório executivo e salva em PDF.
     Retorna o caminho do arquivo gerado.
     """
-    return t.gerar_relatorio_pdf(t.df.copy(), output_path=output_path, top_n=top_n)
+    return t.gerar_relatorio_pdf(_dados(), output_path=output_path, top_n=top_n)
+
+
+# =========================
+# 8b) Modo aproximado (sketches)
+# =========================
+def tool_resumo_aproximado() -> dict:
+    """
+    Visão geral instantânea do dataset completo: nº de produtos e locais distintos
+    (HyperLogLog), quantis de preço e nível de serviço (p50/p90/p99) e totais.
+    Cada número vem com sua margem de erro. Use para perguntas exploratórias.
+    """
+    return sk.resumo_aproximado(_sketches())
+
 
+def tool_amostra_linhas(n: int = 20) -> str:
+    """
+    Retorna n linhas sorteadas uniformemente do dataset (amostra mantida no ingest).
+    """
+    amostra = sk.amostra_linhas(_sketches(), n=n)
+    if amostra.empty:
+        return "Dataset vazio."
+    return rs.renderizar(amostra, f"amostra aleatória de {len(amostra)} linhas", n=n)
+
+
+# =========================
+# 8c) Datasets (registro)
+# =========================
+def tool_listar_datasets() -> list:
+    """
+    Lista os datasets de vendas disponíveis (exports por região/unidade de negócio)
+    e indica qual está em uso nesta conversa.
+    """
+    atual = dataset_atual() or datasets.DATASET_PADRAO
+    return [{**d, "em_uso": d["dataset"] == atual} for d in datasets.listar()]
+
+
+def tool_usar_dataset(nome: str) -> str:
+    """
+    Troca o dataset de vendas usado nesta conversa (ex: 'norte', 'sul').
+    Todas as ferramentas passam a responder sobre ele.
+    """
+    try:
+        _, versao = t.snapshot(nome)
+    except KeyError as e:
+        return f"Erro: {e}"
+    selecionar_dataset(None if nome == datasets.DATASET_PADRAO else nome)
+    return f"Dataset em uso nesta conversa: {nome} (versão {versao[1]})."
+
+
+# =========================
+# 9) Resultados anteriores (handles resultado_id)
+# =========================
+def tool_resultados_listar() -> list:
+    """
+    Lista os resultados guardados nesta conversa (resultado_id, linhas, colunas).
+    """
+    return rs.store.listar()
 
+
+def tool_resultado_filtrar(resultado_id: str, coluna: str, operador: str, valor: str) -> str:
+    """
+    Filtra um resultado anterior (ex: 'e desses, quais são do local X?') sem recalcular.
+    operador: ==, !=, >, >=, <, <=, contem, em (valores separados por vírgula).
+    Gera um novo resultado_id.
+    """
+    try:
+        df = rs.filtrar(rs.store.obter(resultado_id), coluna, operador, valor)
+    except (KeyError, ValueError, TypeError) as e:
+        return f"Erro: {e}"
+    if df.empty:
+        return "Nenhuma linha atende ao filtro."
+    return rs.renderizar(df, f"{resultado_id} filtrado por {coluna} {operador} {valor}")
+
+
+def tool_resultado_ordenar(resultado_id: str, coluna: str, ascendente: bool = False, top_n: int = 20) -> str:
+    """
+    Ordena um resultado anterior por uma coluna e mostra as top_n linhas.
+    """
+    try:
+        df = rs.ordenar(rs.store.obter(resultado_id), coluna, ascendente=ascendente)
+    except KeyError as e:
+        return f"Erro: {e}"
+    return rs.renderizar(df, f"{resultado_id} ordenado por {coluna}", n=top_n)
+
+
+def tool_resultado_agregar(resultado_id: str, agrupar_por: list[str], coluna: str, funcao: str = "sum") -> str:
+    """
+    Agrega um resultado anterior: agrupa por colunas e aplica sum/mean/min/max/count/median/nunique.
+    """
+    try:
+        df = rs.agregar(rs.store.obter(resultado_id), agrupar_por, coluna, funcao=funcao)
+    except (KeyError, ValueError) as e:
+        return f"Erro: {e}"
+    return rs.renderizar(df, f"{resultado_id} agregado: {funcao}({coluna}) por {agrupar_por}")
+
+
+def tool_resultado_pagina(resultado_id: str, pagina: int = 1, tamanho: int = 50) -> str:
+    """
+    Mostra outra página de um resultado anterior (pagina começa em 1).
+    """
+    try:
+        df = rs.store.obter(resultado_id)
+    except KeyError as e:
+        return f"Erro: {e}"
+    pagina_df = rs.paginar(df, pagina=pagina, tamanho=tamanho)
+    if pagina_df.empty:
+        return f"Página {pagina} vazia ({len(df)} linhas no total)."
+    return f"[{resultado_id} | página {pagina} de {-(-len(df) // tamanho)}]\n" + pagina_df.to_string(index=False)
+
+
+@com_filtros
 def tool_q1_produto_maior_desvio_absoluto() -> dict:
-    return t.q1_produto_maior_desvio_absoluto(t.df.copy())
+    return t.q1_produto_maior_desvio_absoluto(_dados())
 
+@com_filtros
 def tool_q2_local_maior_desvio_percentual_medio() -> dict:
-    return t.q2_local_maior_desvio_percentual_medio(t.df.copy())
+    return t.q2_local_maior_desvio_percentual_medio(_dados())
 
+@com_filtros
 def tool_q3_top5_volume_maior_preco_medio() -> dict:
-    return t.q3_top5_volume_maior_preco_medio(t.df.copy())
+    return t.q3_top5_volume_maior_preco_medio(_dados())
 
+@com_filtros
 def tool_q4_mes_menor_volume() -> dict:
-    return t.q4_mes_menor_volume(t.df.copy())
+    return t.q4_mes_menor_volume(rollups=_rollups())
 
+@com_filtros
 def tool_q5_top10_volume_menor_receita_unitaria() -> dict:
-    return t.q5_top10_volume_menor_receita_unitaria(t.df.copy())
+    return t.q5_top10_volume_menor_receita_unitaria(_dados())
 
+@com_filtros
 def tool_q6_media_volume_diario() -> dict:
-    return t.q6_media_volume_diario(t.df.copy())
+    return t.q6_media_volume_diario(rollups=_rollups())
 
+@com_filtros
 def tool_q7_maior_delta_volume_com_promocao() -> dict:
-    return t.q7_maior_delta_volume_com_promocao(t.df.copy())
+    return t.q7_maior_delta_volume_com_promocao(_dados())
 
+@com_filtros
 def tool_q8_share_receita_por_local() -> dict:
-    return t.q8_share_receita_por_local(t.df.copy())
+    return t.q8_share_receita_por_local(_dados())
 
+@com_filtros
 def tool_q9_maior_pico_diario_produto() -> dict:
-    return t.q9_maior_pico_diario_produto(t.df.copy())
+    return t.q9_maior_pico_diario_produto(rollups=_rollups())
 
+@com_filtros
 def tool_q10_impacto_remover_top_receita() -> dict:
-    return t.q10_impacto_remover_top_receita(t.df.copy())
+    return t.q10_impacto_remover_top_receita(_dados())
 
 
 
+NAO_MEMOIZAVEIS: set = set()
+
+
+def _tool(fn, name: str, amostravel: bool = False, memoizavel: bool = True) -> FunctionTool:
+    """
+    FunctionTool cuja versão async roda a função em thread via asyncio.to_thread,
+    que (ao contrário de run_in_executor) propaga os contextvars da pergunta
+    (sessão, contagem de tokens) para dentro da tool.
+    Toda chamada passa por tool_memory.medir (orçamento e perfil de memória).
+    amostravel=True só para listagens de linhas e médias gerais: acima do orçamento de
+    memória elas podem rodar sobre uma amostra; as demais (somas, contagens e agrupamentos
+    por produto/local, em que a amostra sumiria com grupos inteiros) são rejeitadas.
+    memoizavel=False para tools cujo resultado depende do estado da sessão (resultados
+    guardados, dataset em uso, arquivos): ficam fora do memo do turno.
+    """
+    if not memoizavel:
+        NAO_MEMOIZAVEIS.add(name)
+
+    @functools.wraps(fn)
+    def _fn(*args, **kwargs):
+        return tm.medir(name, fn, args, kwargs, amostravel=amostravel)
+
+    @functools.wraps(fn)
+    async def _async_fn(*args, **kwargs):
+        return await asyncio.to_thread(_fn, *args, **kwargs)
+
+    return FunctionTool.from_defaults(fn=_fn, async_fn=_async_fn, name=name)
+
 
 TOOLS = [
-    FunctionTool.from_defaults(fn=tool_consulta_geral, name="consulta_geral"),
+    _tool(fn=tool_consulta_geral, name="consulta_geral"),
+    _tool(fn=tool_consulta_metricas, name="consulta_metricas"),
         # 1) Planejamento / ruptura
-    FunctionTool.from_defaults(fn=tool_calcular_acuracia_planejamento, name="calcular_acuracia_planejamento"),
-    FunctionTool.from_defaults(fn=tool_identificar_ruptura_ou_excesso, name="identificar_ruptura_ou_excesso"),
+    _tool(fn=tool_calcular_acuracia_planejamento, name="calcular_acuracia_planejamento", amostravel=True),
+    _tool(fn=tool_identificar_ruptura_ou_excesso, name="identificar_ruptura_ou_excesso", amostravel=True),
+    _tool(fn=tool_anomalias_ruptura_excesso, name="anomalias_ruptura_excesso"),
 
     # 2) Promoção por produto
-    FunctionTool.from_defaults(fn=tool_impacto_promocao_por_produto, name="impacto_promocao_por_produto"),
+    _tool(fn=tool_impacto_promocao_por_produto, name="impacto_promocao_por_produto"),
+    _tool(fn=tool_elasticidade_preco, name="elasticidade_preco"),
+    _tool(fn=tool_previsao_demanda, name="previsao_demanda"),
 
     # 3) Ranking / Top produtos
-    FunctionTool.from_defaults(fn=tool_ranking_receita_por_local, name="ranking_receita_por_local"),
-    FunctionTool.from_defaults(fn=tool_produtos_mais_vendidos, name="produtos_mais_vendidos"),
+    _tool(fn=tool_ranking_receita_por_local, name="ranking_receita_por_local"),
+    _tool(fn=tool_produtos_mais_vendidos, name="produtos_mais_vendidos"),
+    _tool(fn=tool_curva_abc_resumo, name="curva_abc_resumo"),
+    _tool(fn=tool_curva_abc_membros, name="curva_abc_membros"),
 
     # 4) Serviço
-    FunctionTool.from_defaults(fn=tool_analisar_degradacao_servico, name="analisar_degradacao_servico"),
+    _tool(fn=tool_analisar_degradacao_servico, name="analisar_degradacao_servico"),
 
     # 5) Readme helpers
-    FunctionTool.from_defaults(fn=tool_top_entidades, name="top_entidades"),
-    FunctionTool.from_defaults(fn=tool_vendas_por_periodo, name="vendas_por_periodo"),
-    FunctionTool.from_defaults(fn=tool_gap_planejamento, name="gap_planejamento"),
+    _tool(fn=tool_top_entidades, name="top_entidades"),
+    _tool(fn=tool_vendas_por_periodo, name="vendas_por_periodo"),
+    _tool(fn=tool_vendas_por_calendario, name="vendas_por_calendario"),
+    _tool(fn=tool_gap_planejamento, name="gap_planejamento"),
 
      # 5b) extras
-    FunctionTool.from_defaults(fn=tool_promocao_share, name="promocao_share"),
-    FunctionTool.from_defaults(fn=tool_preco_medio_geral, name="preco_medio_geral"),
-    FunctionTool.from_defaults(fn=tool_produto_maior_receita, name="produto_maior_receita"),
+    _tool(fn=tool_promocao_share, name="promocao_share"),
+    _tool(fn=tool_preco_medio_geral, name="preco_medio_geral", amostravel=True),
+    _tool(fn=tool_produto_maior_receita, name="produto_maior_receita"),
 
     # 6) Promoção (por tipo)
-    FunctionTool.from_defaults(fn=tool_impacto_promocao, name="impacto_promocao"),
+    _tool(fn=tool_impacto_promocao, name="impacto_promocao", amostravel=True),
 
     # 7) Risco serviço
-    FunctionTool.from_defaults(fn=tool_risco_servico, name="risco_servico"),
+    _tool(fn=tool_risco_servico, name="risco_servico"),
     # 8) relatorio
-    FunctionTool.from_defaults(fn=tool_gerar_relatorio, name="gerar_relatorio"),
-    FunctionTool.from_defaults(fn=tool_gerar_relatorio_pdf, name="gerar_relatorio_pdf"),
-
-    FunctionTool.from_defaults(fn=tool_q1_produto_maior_desvio_absoluto, name="produto_maior_desvio_absoluto"),
-    FunctionTool.from_defaults(fn=tool_q2_local_maior_desvio_percentual_medio, name="local_maior_desvio_percentual_medio"),
-    FunctionTool.from_defaults(fn=tool_q3_top5_volume_maior_preco_medio, name="top5_volume_maior_preco_medio"),
-    FunctionTool.from_defaults(fn=tool_q4_mes_menor_volume, name="mes_menor_volume"),
-    FunctionTool.from_defaults(fn=tool_q5_top10_volume_menor_receita_unitaria, name="top10_volume_menor_receita_unitaria"),
-    FunctionTool.from_defaults(fn=tool_q6_media_volume_diario, name="media_volume_diario"),
-    FunctionTool.from_defaults(fn=tool_q7_maior_delta_volume_com_promocao, name="maior_delta_promocao"),
-    FunctionTool.from_defaults(fn=tool_q8_share_receita_por_local, name="share_receita_por_local"),
-    FunctionTool.from_defaults(fn=tool_q9_maior_pico_diario_produto, name="pico_diario_produto"),
-    FunctionTool.from_defaults(fn=tool_q10_impacto_remover_top_receita, name="impacto_remover_top_receita"),
+    _tool(fn=tool_gerar_relatorio, name="gerar_relatorio"),
+    _tool(fn=tool_gerar_relatorio_pdf, name="gerar_relatorio_pdf"),
+    _tool(fn=tool_resumo_aproximado, name="resumo_aproximado"),
+    _tool(fn=tool_amostra_linhas, name="amostra_linhas"),
+
+    _tool(fn=tool_q1_produto_maior_desvio_absoluto, name="produto_maior_desvio_absoluto"),
+    _tool(fn=tool_q2_local_maior_desvio_percentual_medio, name="local_maior_desvio_percentual_medio"),
+    _tool(fn=tool_q3_top5_volume_maior_preco_medio, name="top5_volume_maior_preco_medio"),
+    _tool(fn=tool_q4_mes_menor_volume, name="mes_menor_volume"),
+    _tool(fn=tool_q5_top10_volume_menor_receita_unitaria, name="top10_volume_menor_receita_unitaria"),
+    _tool(fn=tool_q6_media_volume_diario, name="media_volume_diario"),
+    _tool(fn=tool_q7_maior_delta_volume_com_promocao, name="maior_delta_promocao"),
+    _tool(fn=tool_q8_share_receita_por_local, name="share_receita_por_local"),
+    _tool(fn=tool_q9_maior_pico_diario_produto, name="pico_diario_produto"),
+    _tool(fn=tool_q10_impacto_remover_top_receita, name="impacto_remover_top_receita"),
+
+    # 9) resultados anteriores
+    _tool(fn=tool_listar_datasets, name="listar_datasets", memoizavel=False),
+    _tool(fn=tool_usar_dataset, name="usar_dataset", memoizavel=False),
+    _tool(fn=tool_exportar_resultado, name="exportar_resultado", memoizavel=False),
+    _tool(fn=tool_resultados_listar, name="resultados_listar", memoizavel=False),
+    _tool(fn=tool_resultado_filtrar, name="resultado_filtrar", memoizavel=False),
+    _tool(fn=tool_resultado_ordenar, name="resultado_ordenar", memoizavel=False),
+    _tool(fn=tool_resultado_agregar, name="resultado_agregar", memoizavel=False),
+    _tool(fn=tool_resultado_pagina, name="resultado_pagina", memoizavel=False),
 ]
+
+# consulta SQL só entra se o duckdb (opcional) estiver instalado
+if sql_engine.disponivel():
+    TOOLS.insert(1, _tool(fn=tool_consulta_sql, name="consulta_sql"))
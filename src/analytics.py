@@ -2,17 +2,27 @@ import pandas as pd
 import numpy as np
 pd.set_option('display.max_rows', 50) 
 pd.set_option('display.max_columns', None)
-df = pd.read_csv("data/sales.csv", sep=";", low_memory=False)
-df['date'] = pd.to_datetime(df['date'], dayfirst=True)
 
+import os
+import threading
+import time
 from pathlib import Path
 
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_LEFT
-from reportlab.lib import colors
+import datasets
+from sessao import dataset_atual
+
+DATA_PATH = os.getenv("SALES_CSV", "data/sales.csv")
+DATASET_PADRAO = datasets.DATASET_PADRAO
+
+
+def carregar_dataset(caminho: str = DATA_PATH) -> pd.DataFrame:
+    """Lê o CSV de vendas (sep=';', datas dd/mm/aaaa)."""
+    dados = pd.read_csv(caminho, sep=";", low_memory=False)
+    dados['date'] = pd.to_datetime(dados['date'], dayfirst=True)
+    return dados
+
+
+df = datasets.abrir(DATASET_PADRAO, carregar_dataset, DATA_PATH)
 
 def formatar_grandeza(valor):
     if valor >= 1_000_000_000:
@@ -33,6 +43,164 @@ def _safe_div(numer, denom, fill_value=np.nan):
     return out.fillna(fill_value)
 
 
+# =========================
+# Datasets ativos: versão, caches derivados e recarga a quente
+# =========================
+# Cada dataset nomeado (ver datasets.py) tem seu (df, versão), trocados juntos. A versão
+# é (nome do dataset, n), então os caches derivados nunca se misturam entre datasets.
+# Quem já pegou a referência ao df antigo termina sobre ele; chamadas novas enxergam a
+# versão nova. `df` continua apontando para o dataset padrão.
+DATASET_VERSION = 1
+_ATIVOS: dict = {DATASET_PADRAO: (df, (DATASET_PADRAO, DATASET_VERSION))}
+_CACHE_DERIVADOS: dict = {}
+_BUILDERS: dict = {}
+_LIBERADORES: dict = {}
+_LOCKS_CACHE: dict = {}
+_LOCK_CACHE = threading.Lock()
+_LOCK_RECARGA = threading.Lock()
+
+
+def _nome_dataset(dataset: str | None = None) -> str:
+    return dataset or dataset_atual() or DATASET_PADRAO
+
+
+def snapshot(dataset: str | None = None) -> tuple:
+    """
+    (df, versão) do dataset da sessão atual (ou de `dataset`), lidos de forma consistente.
+    Datasets do registro são abertos no primeiro uso.
+    """
+    nome = _nome_dataset(dataset)
+    ativo = _ATIVOS.get(nome)
+    if ativo is None:
+        datasets.caminho(nome)  # KeyError se não registrado
+        with _LOCK_RECARGA:
+            if nome not in _ATIVOS:
+                _ATIVOS[nome] = (datasets.abrir(nome, carregar_dataset), (nome, 1))
+            ativo = _ATIVOS[nome]
+    return ativo
+
+
+def em_cache(nome: str, snap: tuple | None = None) -> bool:
+    """True se o derivado `nome` já está calculado para a versão (sem calcular)."""
+    return (nome, (snap or snapshot())[1]) in _CACHE_DERIVADOS
+
+
+def cache_por_versao(nome: str, builder, snap: tuple | None = None, liberar=None):
+    """
+    Calcula builder(df) uma única vez por versão do dataset e reaproveita o resultado
+    nas chamadas seguintes (ex: séries de anomalias, curvas, coeficientes).
+    `snap` fixa o (df, versão) usado, para casar com um df já obtido via snapshot().
+    `liberar(resultado)` é chamado quando a versão sai do cache (ex: apagar arquivos).
+    """
+    dados, versao = snap or snapshot()
+    chave = (nome, versao)
+    if chave in _CACHE_DERIVADOS:
+        return _CACHE_DERIVADOS[chave]
+
+    with _LOCK_CACHE:
+        _BUILDERS[nome] = builder
+        if liberar is not None:
+            _LIBERADORES[nome] = liberar
+        lock = _LOCKS_CACHE.setdefault(chave, threading.Lock())
+    with lock:  # evita que duas chamadas simultâneas calculem o mesmo derivado
+        if chave in _CACHE_DERIVADOS:
+            return _CACHE_DERIVADOS[chave]
+        resultado = builder(dados)
+        # uma recarga pode ter trocado a versão durante o builder: só guarda se a versão
+        # ainda for a ativa (a checagem e a limpeza da recarga usam o mesmo lock)
+        with _LOCK_CACHE:
+            ativo = _ATIVOS.get(versao[0])
+            if ativo is not None and ativo[1] == versao:
+                _CACHE_DERIVADOS[chave] = resultado
+    return resultado
+
+
+def recarregar_dataset(caminho: str | None = None, preaquecer: bool = True, dataset: str | None = None) -> dict:
+    """
+    Lê o dataset (o da sessão atual, ou `dataset`) novamente e troca a versão ativa
+    de forma atômica. Com preaquecer=True, os derivados já usados na versão atual são
+    recalculados para a nova versão ANTES da troca, então as primeiras perguntas não
+    pagam esse custo. Em caso de erro na leitura, a versão atual continua ativa.
+    """
+    global df, DATASET_VERSION
+
+    nome = _nome_dataset(dataset)
+    if caminho:
+        datasets.registrar(nome, caminho)
+    csv = datasets.caminho(nome)
+
+    with _LOCK_RECARGA:
+        inicio = time.perf_counter()
+        novo = datasets.abrir(nome, carregar_dataset, csv)
+        versao_atual = _ATIVOS[nome][1] if nome in _ATIVOS else (nome, 0)
+        nova_versao = (nome, versao_atual[1] + 1)
+
+        if preaquecer:
+            for derivado, builder in list(_BUILDERS.items()):
+                if (derivado, versao_atual) in _CACHE_DERIVADOS:
+                    _CACHE_DERIVADOS[(derivado, nova_versao)] = builder(novo)
+
+        _ATIVOS[nome] = (novo, nova_versao)
+        if nome == DATASET_PADRAO:
+            df, DATASET_VERSION = novo, nova_versao[1]
+
+        removidos = []
+        with _LOCK_CACHE:
+            for chave in [c for c in _CACHE_DERIVADOS if c[1][0] == nome and c[1][1] < nova_versao[1]]:
+                removidos.append((chave[0], _CACHE_DERIVADOS.pop(chave, None)))
+            for chave in [c for c in _LOCKS_CACHE if c[1][0] == nome and c[1][1] < nova_versao[1]]:
+                _LOCKS_CACHE.pop(chave, None)
+        for derivado, resultado in removidos:
+            if derivado in _LIBERADORES and resultado is not None:
+                _LIBERADORES[derivado](resultado)
+
+    return {
+        "dataset": nome,
+        "versao": nova_versao[1],
+        "linhas": int(len(novo)),
+        "caminho": csv,
+        "segundos": round(time.perf_counter() - inicio, 3),
+    }
+
+
+def _assinatura_arquivo(caminho: str):
+    st = os.stat(caminho)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def iniciar_monitoramento(
+    caminho: str | None = None,
+    intervalo: float = 5.0,
+    dataset: str = DATASET_PADRAO,
+) -> threading.Thread:
+    """
+    Observa o CSV de um dataset em uma thread de fundo e recarrega quando ele muda.
+    Só recarrega depois de duas leituras iguais seguidas (arquivo terminou de ser escrito).
+    """
+    caminho = caminho or datasets.caminho(dataset)
+
+    def _loop():
+        atual = _assinatura_arquivo(caminho)
+        while True:
+            time.sleep(intervalo)
+            try:
+                visto = _assinatura_arquivo(caminho)
+                if visto == atual:
+                    continue
+                time.sleep(intervalo)
+                if _assinatura_arquivo(caminho) != visto:
+                    continue  # ainda sendo escrito
+                info = recarregar_dataset(caminho, dataset=dataset)
+                atual = visto
+                print(f"[dataset '{dataset}' recarregado: versão {info['versao']}, {info['linhas']} linhas]")
+            except Exception as e:
+                print(f"[falha ao recarregar dataset, mantendo versão atual: {e}]")
+
+    thread = threading.Thread(target=_loop, name=f"monitor-dataset-{dataset}", daemon=True)
+    thread.start()
+    return thread
+
+
 # =========================
 # 1) Acurácia de planejamento
 # =========================
@@ -40,18 +208,17 @@ def calcular_acuracia_planejamento(df: pd.DataFrame) -> pd.DataFrame:
     """
     Calcula a diferença percentual entre o planejado e o realizado.
     Corrigido: evita divisão por zero (planned_quantity = 0).
+    Só as colunas de saída são copiadas (não o dataset inteiro).
     """
-    base = df.copy()
-    base["variacao_quantidade"] = base["actual_quantity"] - base["planned_quantity"]
-
+    base = df[["product_id", "date", "planned_quantity", "actual_quantity"]].copy()
+    variacao = base["actual_quantity"] - base["planned_quantity"]
 
     base["pct_desvio"] = np.where(
         base["planned_quantity"] > 0,
-        (base["variacao_quantidade"] / base["planned_quantity"]) * 100,
+        (variacao / base["planned_quantity"]) * 100,
         np.nan,
     )
-
-    return base[["product_id", "date", "planned_quantity", "actual_quantity", "pct_desvio"]]
+    return base
 
 
 def identificar_ruptura_ou_excesso(df: pd.DataFrame, threshold: float = 0.2) -> pd.DataFrame:
@@ -59,19 +226,15 @@ def identificar_ruptura_ou_excesso(df: pd.DataFrame, threshold: float = 0.2) ->
     Identifica casos onde a venda real foi muito abaixo (risco de excesso)
     ou muito acima (risco de ruptura/falta de estoque) do planejado.
     Corrigido: planned_quantity = 0 vira NaN e não entra em alerta por razão.
+    A razão é calculada em arrays; só as linhas em alerta são copiadas.
     """
-    base = df.copy()
+    plan = df["planned_quantity"].to_numpy(dtype=float)
+    real = df["actual_quantity"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        razao = np.where(plan > 0, real / plan, np.nan)
 
-    base["razao_real_plan"] = np.where(
-        base["planned_quantity"] > 0,
-        base["actual_quantity"] / base["planned_quantity"],
-        np.nan,
-    )
-
-    alertas = base[
-        (base["razao_real_plan"] < (1 - threshold)) | (base["razao_real_plan"] > (1 + threshold))
-    ]
-    return alertas
+    alerta = (razao < (1 - threshold)) | (razao > (1 + threshold))
+    return df[alerta].assign(razao_real_plan=razao[alerta])
 
 
 # =========================
@@ -506,7 +669,13 @@ def gerar_relatorio_executivo(
 
 def salvar_relatorio_pdf(relatorio_texto: str, output_path: str) -> str:
     """Salva o texto do relatório em PDF e retorna o caminho."""
-
+    # ReportLab só é importado quando um PDF é realmente gerado (é pesado e raro)
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.enums import TA_LEFT
+    from reportlab.lib import colors
 
     out = Path(output_path)
     out.parent.mkdir(parents=True, exist_ok=True)
@@ -654,19 +823,29 @@ def q3_top5_volume_maior_preco_medio(df: pd.DataFrame, top_n: int = 5) -> dict:
     return {"top_n": top_n, "product_id": pid, "preco_medio": val, "preco_medio_fmt": f"{val:.2f}"}
 
 
-def q4_mes_menor_volume(df: pd.DataFrame) -> dict:
+def q4_mes_menor_volume(df: pd.DataFrame | None = None, rollups: dict | None = None) -> dict:
     """
     Pergunta 4: Qual mês teve o menor volume de vendas?
+    Cada mês é um período ano+mês (chave YYYYMM): março/2023 e março/2024 não se somam.
     """
-    base = _prepare_sales_base(df)
-    if not {"date", "actual_quantity"}.issubset(base.columns):
-        return {"erro": "Colunas necessárias não encontradas: date, actual_quantity"}
-
-    base["month"] = base["date"].dt.month
-    serie = base.groupby("month")["actual_quantity"].sum().sort_values()
-    mes = int(serie.index[0])
-    vol = float(serie.iloc[0])
-    return {"mes": mes, "volume_total": vol, "volume_fmt": formatar_grandeza(vol)}
+    if rollups is None:
+        if not {"date", "actual_quantity"}.issubset(df.columns):
+            return {"erro": "Colunas necessárias não encontradas: date, actual_quantity"}
+        rollups = construir_rollups(df, granularidades=("mes",))
+
+    mensal = rollups["mes"]["total"]
+    if mensal.empty:
+        return {"erro": "Sem datas válidas para agrupar por mês."}
+    linha = mensal.loc[mensal["volume"].idxmin()]
+    chave = int(linha["periodo"])
+    vol = float(linha["volume"])
+    return {
+        "mes": chave % 100,
+        "ano": chave // 100,
+        "periodo": formatar_periodo("mes", chave),
+        "volume_total": vol,
+        "volume_fmt": formatar_grandeza(vol),
+    }
 
 
 def q5_top10_volume_menor_receita_unitaria(df: pd.DataFrame, top_n: int = 10) -> dict:
@@ -689,16 +868,16 @@ def q5_top10_volume_menor_receita_unitaria(df: pd.DataFrame, top_n: int = 10) ->
     return {"top_n": top_n, "product_id": pid, "receita_por_unidade": val, "receita_por_unidade_fmt": f"{val:.2f}"}
 
 
-def q6_media_volume_diario(df: pd.DataFrame) -> dict:
+def q6_media_volume_diario(df: pd.DataFrame | None = None, rollups: dict | None = None) -> dict:
     """
     Pergunta 6: Qual a média de vendas diárias (volume)?
     """
-    base = _prepare_sales_base(df)
-    if not {"date", "actual_quantity"}.issubset(base.columns):
-        return {"erro": "Colunas necessárias não encontradas: date, actual_quantity"}
+    if rollups is None:
+        if not {"date", "actual_quantity"}.issubset(df.columns):
+            return {"erro": "Colunas necessárias não encontradas: date, actual_quantity"}
+        rollups = construir_rollups(df, granularidades=("dia",))
 
-    daily = base.groupby(base["date"].dt.date)["actual_quantity"].sum()
-    val = float(daily.mean())
+    val = float(rollups["dia"]["total"]["volume"].mean())
     return {"media_volume_diario": val, "media_fmt": formatar_grandeza(val)}
 
 
@@ -746,21 +925,24 @@ def q8_share_receita_por_local(df: pd.DataFrame) -> dict:
     return {"share_receita_por_local": {str(k): f"{float(v):.2f}%" for k, v in serie.items()}}
 
 
-def q9_maior_pico_diario_produto(df: pd.DataFrame) -> dict:
+def q9_maior_pico_diario_produto(df: pd.DataFrame | None = None, rollups: dict | None = None) -> dict:
     """
     Pergunta 9: Qual produto teve o maior volume vendido em um único dia?
     """
-    base = _prepare_sales_base(df)
-    if not {"product_id", "date", "actual_quantity"}.issubset(base.columns):
-        return {"erro": "Colunas necessárias não encontradas: product_id, date, actual_quantity"}
+    if rollups is None:
+        if not {"product_id", "date", "actual_quantity"}.issubset(df.columns):
+            return {"erro": "Colunas necessárias não encontradas: product_id, date, actual_quantity"}
+        rollups = construir_rollups(df, granularidades=("dia",))
 
-    serie = base.groupby(["product_id", base["date"].dt.date])["actual_quantity"].sum()
-    (pid, dia) = serie.idxmax()
-    val = float(serie.max())
+    diario = rollups["dia"]["product_id"].dropna(subset=["product_id"])
+    if diario.empty:
+        return {"erro": "Sem dados de product_id/date/actual_quantity."}
+    linha = diario.loc[diario["volume"].idxmax()]
+    val = float(linha["volume"])
 
     return {
-        "product_id": str(pid),
-        "data": str(dia),
+        "product_id": str(linha["product_id"]),
+        "data": formatar_periodo("dia", int(linha["periodo"])),
         "volume_no_dia": val,
         "volume_fmt": formatar_grandeza(val),
     }
@@ -788,3 +970,624 @@ def q10_impacto_remover_top_receita(df: pd.DataFrame) -> dict:
         "impacto_percentual": impacto,
         "impacto_fmt": f"{impacto:.2f}%",
     }
+
+
+# =========================
+# 11) Anomalias de ruptura/excesso por série (product_id, local)
+# =========================
+def detectar_anomalias_series(
+    df: pd.DataFrame,
+    janela: int = 28,
+    min_periodos: int = 7,
+    z_limite: float = 2.5,
+) -> pd.DataFrame:
+    """
+    Detecta desvios persistentes entre realizado e planejado em todas as séries
+    diárias (product_id, local) de uma vez, sem loop por série.
+
+    Para cada dia, o resíduo (actual - planned) é comparado com a média/desvio dos dias
+    com venda registrada nos `janela` dias de calendário anteriores da mesma série
+    (somas acumuladas + busca binária pela data; dias sem registro não entram, e
+    min_periodos conta dias com registro). Dias de calendário consecutivos com
+    |z| >= z_limite no mesmo sentido formam um episódio (um dia sem registro no meio
+    encerra o episódio): z > 0 = ruptura (venda acima do plano), z < 0 = excesso.
+    Retorna um episódio por linha, ordenado por severidade (soma de |z| no episódio).
+    """
+    base = _prepare_sales_base(df)
+    diario = (
+        base.groupby(["product_id", "local", base["date"].dt.normalize()], sort=True, observed=True)
+        [["actual_quantity", "planned_quantity"]]
+        .sum()
+        .reset_index()
+    )
+
+    colunas = ["product_id", "local", "tipo", "inicio", "fim", "dias", "z_max", "desvio_total",
+               "real_total", "planejado_total", "severidade", "nivel"]
+    n = len(diario)
+    if n == 0:
+        return pd.DataFrame(columns=colunas)
+
+    pid = diario["product_id"].to_numpy()
+    loc = diario["local"].to_numpy()
+    residuo = (diario["actual_quantity"] - diario["planned_quantity"]).to_numpy(dtype=float)
+
+    # limites de série (dados já ordenados por product_id, local, date)
+    novo = np.empty(n, dtype=bool)
+    novo[0] = True
+    novo[1:] = (pid[1:] != pid[:-1]) | (loc[1:] != loc[:-1])
+    gid = np.cumsum(novo) - 1
+    dia = diario["date"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+    dia = dia - dia.min()
+
+    # janela móvel de calendário [dia - janela, dia) restrita à própria série: a chave
+    # (série, dia) é crescente, e o espaçamento entre séries impede a busca de sair dela
+    chave = gid * (int(dia.max()) + janela + 2) + dia
+    pos = np.arange(n)
+    lo = np.searchsorted(chave, chave - janela, side="left")
+    cnt = pos - lo
+
+    cs = np.concatenate(([0.0], np.cumsum(residuo)))
+    cs2 = np.concatenate(([0.0], np.cumsum(residuo * residuo)))
+    soma = cs[pos] - cs[lo]
+    soma2 = cs2[pos] - cs2[lo]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        media = soma / cnt
+        var = (soma2 - cnt * media * media) / (cnt - 1)
+        std = np.sqrt(np.maximum(var, 0))
+        valido = (cnt >= max(min_periodos, 2)) & (std > 0)
+        z = np.where(valido, (residuo - media) / std, 0.0)
+
+    sinal = np.where(z >= z_limite, 1, np.where(z <= -z_limite, -1, 0))
+
+    # episódios: dias de calendário seguidos com o mesmo sinal dentro da mesma série
+    quebra = np.empty(n, dtype=bool)
+    quebra[0] = True
+    quebra[1:] = (sinal[1:] != sinal[:-1]) | novo[1:] | (np.diff(dia) > 1)
+    episodio = np.cumsum(quebra) - 1
+
+    flag = sinal != 0
+    if not flag.any():
+        return pd.DataFrame(columns=colunas)
+
+    marcados = diario.loc[flag, ["product_id", "local", "date", "actual_quantity", "planned_quantity"]].assign(
+        episodio=episodio[flag], sinal=sinal[flag], z=z[flag], abs_z=np.abs(z[flag]), residuo=residuo[flag]
+    )
+    out = (
+        marcados.groupby("episodio", sort=False)
+        .agg(
+            product_id=("product_id", "first"),
+            local=("local", "first"),
+            sinal=("sinal", "first"),
+            inicio=("date", "min"),
+            fim=("date", "max"),
+            dias=("date", "size"),
+            z_max=("abs_z", "max"),
+            desvio_total=("residuo", "sum"),
+            real_total=("actual_quantity", "sum"),
+            planejado_total=("planned_quantity", "sum"),
+            severidade=("abs_z", "sum"),
+        )
+        .reset_index(drop=True)
+    )
+    out["tipo"] = np.where(out["sinal"] > 0, "ruptura", "excesso")
+    out["nivel"] = np.select(
+        [(out["dias"] >= 3) | (out["z_max"] >= 2 * z_limite), out["dias"] >= 2],
+        ["alta", "media"],
+        default="baixa",
+    )
+    return out.sort_values("severidade", ascending=False, ignore_index=True)[colunas]
+
+
+def consultar_anomalias(
+    anomalias: pd.DataFrame,
+    tipo: str | None = None,
+    nivel: str | None = None,
+    product_id: str | None = None,
+    local: str | None = None,
+    min_dias: int = 1,
+    top_n: int = 20,
+) -> pd.DataFrame:
+    """Filtra os episódios pré-calculados (já ordenados por severidade)."""
+    mask = anomalias["dias"] >= min_dias
+    if tipo:
+        mask &= anomalias["tipo"] == tipo
+    if nivel:
+        mask &= anomalias["nivel"] == nivel
+    if product_id:
+        mask &= anomalias["product_id"].astype(str) == str(product_id)
+    if local:
+        mask &= anomalias["local"].astype(str) == str(local)
+    return anomalias[mask].head(top_n)
+
+
+# =========================
+# 12) Elasticidade-preço por produto
+# =========================
+COND_MAX_ELASTICIDADE = 1e6
+
+
+def estimar_elasticidade_preco(df: pd.DataFrame, min_obs: int = 10) -> pd.DataFrame:
+    """
+    Ajusta log(actual_quantity) ~ a + b*log(actual_price) + c*promo para TODOS os
+    produtos de uma vez: um único groupby calcula as estatísticas suficientes (X'X, X'y)
+    e os sistemas 3x3 são resolvidos em lote com NumPy.
+    b = elasticidade-preço; efeito_promo_% = (exp(c) - 1) * 100.
+    Só usa linhas com quantidade e preço > 0. Produtos sem variação de preço, com
+    menos de min_obs linhas ou com preço (quase) colinear com a promoção (ex: preço
+    só muda quando há promoção) ficam com elasticidade NaN.
+    """
+    base = _prepare_sales_base(df)
+    validos = (base["actual_quantity"] > 0) & (base["actual_price"] > 0)
+    base = base.loc[validos, ["product_id", "actual_quantity", "actual_price", "promotion_type"]]
+
+    colunas = ["product_id", "n_obs", "elasticidade", "erro_padrao", "efeito_promo_%", "r2", "interpretacao"]
+    if base.empty:
+        return pd.DataFrame(columns=colunas)
+
+    x = np.log(base["actual_price"].to_numpy(dtype=float))
+    y = np.log(base["actual_quantity"].to_numpy(dtype=float))
+    d = base["promotion_type"].notna().to_numpy(dtype=float)
+
+    suf = (
+        pd.DataFrame({
+            "product_id": base["product_id"].to_numpy(),
+            "n": 1.0, "x": x, "d": d, "y": y,
+            "xx": x * x, "xd": x * d, "xy": x * y, "dy": d * y, "yy": y * y,
+        })
+        .groupby("product_id", sort=False)
+        .sum()
+    )
+
+    n = suf["n"].to_numpy()
+    sx, sd, sy = suf["x"].to_numpy(), suf["d"].to_numpy(), suf["y"].to_numpy()
+    sxx, sxd, sxy = suf["xx"].to_numpy(), suf["xd"].to_numpy(), suf["xy"].to_numpy()
+    sdy, syy = suf["dy"].to_numpy(), suf["yy"].to_numpy()
+
+    tem_preco = (sxx / n - (sx / n) ** 2) > 1e-10
+    tem_promo = (sd > 0) & (sd < n)
+
+    k = len(n)
+    A = np.empty((k, 3, 3))
+    A[:, 0] = np.column_stack([n, sx, sd])
+    A[:, 1] = np.column_stack([sx, sxx, sxd])
+    A[:, 2] = np.column_stack([sd, sxd, sd])  # d*d == d
+    b = np.column_stack([sy, sxy, sdy])
+
+    # coeficientes não identificáveis: troca a linha/coluna por identidade (coef = 0)
+    for j, ok in ((1, tem_preco), (2, tem_promo)):
+        sem = ~ok
+        A[sem, j, :] = 0.0
+        A[sem, :, j] = 0.0
+        A[sem, j, j] = 1.0
+        b[sem, j] = 0.0
+
+    # preço (quase) colinear com a flag de promoção num produto: o sistema é singular ou
+    # mal condicionado e os coeficientes não significam nada. O número de condição é
+    # medido na matriz escalada pela diagonal (independe da unidade do preço); esses
+    # produtos ficam com NaN e o sistema deles vira identidade para o lote não falhar.
+    escala = np.sqrt(np.einsum("kii->ki", A))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cond = np.linalg.cond(A / escala[:, :, None] / escala[:, None, :])
+    bem_condicionado = np.isfinite(cond) & (cond < COND_MAX_ELASTICIDADE)
+    A[~bem_condicionado] = np.eye(3)
+    b[~bem_condicionado] = 0.0
+
+    beta = np.linalg.solve(A, b[..., None])[..., 0]
+    inv = np.linalg.inv(A)
+
+    n_params = 1 + tem_preco.astype(int) + tem_promo.astype(int)
+    ssr = np.maximum(syy - np.einsum("ij,ij->i", beta, b), 0)
+    sst = syy - sy * sy / n
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma2 = np.where(n > n_params, ssr / (n - n_params), np.nan)
+        erro_padrao = np.sqrt(sigma2 * inv[:, 1, 1])
+        r2 = np.where(sst > 0, 1 - ssr / sst, np.nan)
+
+    ajustado = bem_condicionado & (n >= min_obs)
+    suficiente = tem_preco & ajustado
+    out = pd.DataFrame({
+        "product_id": suf.index,
+        "n_obs": n.astype(int),
+        "elasticidade": np.where(suficiente, beta[:, 1], np.nan),
+        "erro_padrao": np.where(suficiente, erro_padrao, np.nan),
+        "efeito_promo_%": np.where(tem_promo & ajustado, np.expm1(beta[:, 2]) * 100, np.nan),
+        "r2": np.where(ajustado, r2, np.nan),
+    })
+    out["interpretacao"] = np.select(
+        [out["elasticidade"].isna(), out["elasticidade"] < -1, out["elasticidade"] <= 0],
+        ["indefinida", "elástica", "inelástica"],
+        default="atípica (positiva)",
+    )
+    return out.sort_values("elasticidade", ignore_index=True)[colunas]
+
+
+# =========================
+# 13) Curva ABC (Pareto)
+# =========================
+NIVEIS_ABC = {"produto": ["product_id"], "produto_local": ["product_id", "local"]}
+
+
+def classificar_abc(
+    df: pd.DataFrame,
+    nivel: str = "produto",
+    metrica: str = "receita",
+    limite_a: float = 0.80,
+    limite_b: float = 0.95,
+) -> pd.DataFrame:
+    """
+    Classifica itens (produto ou produto+local) em A/B/C pela participação acumulada
+    em receita ou volume. O item que cruza o limite ainda entra na classe anterior
+    (ex: o produto que leva o acumulado de 78% para 83% é classe A).
+    """
+    if nivel not in NIVEIS_ABC:
+        raise ValueError(f"nivel inválido: {nivel}. Use: {list(NIVEIS_ABC)}")
+    if metrica not in ("receita", "volume"):
+        raise ValueError("metrica deve ser 'receita' ou 'volume'.")
+
+    base = _prepare_sales_base(df)
+    col = "receita" if metrica == "receita" else "actual_quantity"
+    chaves = NIVEIS_ABC[nivel]
+
+    out = (
+        base.groupby(chaves, observed=True)[col]
+        .sum()
+        .sort_values(ascending=False)
+        .rename(metrica)
+        .reset_index()
+    )
+    total = float(out[metrica].sum())
+    share = out[metrica].to_numpy(dtype=float) / total if total else np.zeros(len(out))
+    acumulado = np.cumsum(share)
+    anterior = acumulado - share
+
+    out["rank"] = np.arange(1, len(out) + 1)
+    out["share_%"] = share * 100
+    out["share_acumulado_%"] = acumulado * 100
+    out["classe"] = np.select([anterior < limite_a, anterior < limite_b], ["A", "B"], default="C")
+    return out
+
+
+def resumo_abc(tabela: pd.DataFrame, metrica: str = "receita") -> pd.DataFrame:
+    """Resumo por classe: quantidade de itens e participação no total."""
+    resumo = tabela.groupby("classe").agg(itens=("classe", "size"), valor=(metrica, "sum"))
+    resumo["itens_%"] = resumo["itens"] / resumo["itens"].sum() * 100
+    total = resumo["valor"].sum()
+    resumo["valor_%"] = resumo["valor"] / total * 100 if total else 0.0
+    return resumo.reset_index()
+
+
+# =========================
+# 14) Índices de filtro (listas de linhas por valor)
+# =========================
+COLUNAS_FILTRO = {"locais": "local", "produtos": "product_id", "tipos_promocao": "promotion_type"}
+_NS_POR_DIA = 86_400_000_000_000
+
+
+def construir_indice_filtros(df: pd.DataFrame) -> dict:
+    """
+    Pré-calcula, para local/product_id/promotion_type, as linhas de cada valor
+    (uma única ordenação por coluna; cada valor vira um slice dela) e as linhas
+    ordenadas por data, para resolver filtros sem varrer o dataset inteiro.
+    promotion_type nulo é indexado como 'Sem Promo'.
+    """
+    indice = {"n": len(df), "colunas": {}}
+    for col in COLUNAS_FILTRO.values():
+        serie = df[col]
+        if col == "promotion_type":
+            serie = serie.fillna("Sem Promo")
+        codigos, valores = pd.factorize(serie.astype(str), sort=True)
+        ordem = np.argsort(codigos, kind="stable")
+        limites = np.concatenate(([0], np.cumsum(np.bincount(codigos[codigos >= 0], minlength=len(valores)))))
+        deslocamento = int((codigos < 0).sum())  # nulos ficam no começo da ordenação
+        indice["colunas"][col] = {
+            str(v): ordem[deslocamento + limites[i]:deslocamento + limites[i + 1]]
+            for i, v in enumerate(valores)
+        }
+
+    datas = df["date"].to_numpy(dtype="datetime64[ns]")
+    ordem_data = np.argsort(datas, kind="stable")
+    indice["ordem_data"] = ordem_data
+    indice["datas_ordenadas"] = datas[ordem_data]
+    return indice
+
+
+def mascara_filtros(
+    indice: dict,
+    data_inicio: str | None = None,
+    data_fim: str | None = None,
+    locais: list | None = None,
+    produtos: list | None = None,
+    tipos_promocao: list | None = None,
+) -> np.ndarray | None:
+    """
+    Combina os filtros em uma máscara booleana (AND entre colunas, OR entre valores).
+    Retorna None se nenhum filtro foi informado.
+    """
+    n = indice["n"]
+    mask = None
+
+    def _combinar(parcial):
+        nonlocal mask
+        mask = parcial if mask is None else (mask & parcial)
+
+    for param, valores in (("locais", locais), ("produtos", produtos), ("tipos_promocao", tipos_promocao)):
+        if not valores:
+            continue
+        if isinstance(valores, str):
+            valores = [valores]
+        listas = indice["colunas"][COLUNAS_FILTRO[param]]
+        parcial = np.zeros(n, dtype=bool)
+        for v in valores:
+            linhas = listas.get(str(v))
+            if linhas is not None:
+                parcial[linhas] = True
+        _combinar(parcial)
+
+    if data_inicio or data_fim:
+        datas = indice["datas_ordenadas"]
+        ini = np.searchsorted(datas, np.datetime64(pd.to_datetime(data_inicio)), "left") if data_inicio else 0
+        fim = (
+            np.searchsorted(datas, np.datetime64(pd.to_datetime(data_fim) + pd.Timedelta(days=1)), "left")
+            if data_fim else len(datas)
+        )
+        parcial = np.zeros(n, dtype=bool)
+        parcial[indice["ordem_data"][ini:fim]] = True
+        _combinar(parcial)
+
+    return mask
+
+
+# =========================
+# 15) Previsão de demanda em lote (todas as séries product_id + local)
+# =========================
+MODELOS_PREVISAO = ("naive_sazonal", "media_movel_7", "media_movel_28", "ses_0.1", "ses_0.3", "ses_0.5")
+
+
+def _matriz_diaria(base: pd.DataFrame, historico: int) -> tuple:
+    """
+    Matrizes densas séries x dias (float32) com volume real e planejado dos últimos
+    `historico` dias. Dia sem registro = NaN.
+    """
+    base = base.dropna(subset=["date", "product_id", "local"])
+    dia = base["date"].dt.normalize()
+    dia_fim = dia.max()
+    recorte = dia > dia_fim - pd.Timedelta(days=historico)
+    base, dia = base[recorte], dia[recorte]
+
+    grupos = base.groupby(["product_id", "local"], sort=True, observed=True)
+    serie = grupos.ngroup().to_numpy()
+    chaves = grupos.size().index.to_frame(index=False)[["product_id", "local"]]
+    pos = ((dia - (dia_fim - pd.Timedelta(days=historico - 1))) // pd.Timedelta(days=1)).to_numpy()
+
+    forma = (len(chaves), historico)
+    plano_linear = serie * historico + pos
+    real = np.bincount(plano_linear, weights=base["actual_quantity"].fillna(0).to_numpy(), minlength=forma[0] * forma[1])
+    plan = np.bincount(plano_linear, weights=base["planned_quantity"].fillna(0).to_numpy(), minlength=forma[0] * forma[1])
+    observado = np.bincount(plano_linear, minlength=forma[0] * forma[1]) > 0
+
+    real = np.where(observado, real, np.nan).astype(np.float32).reshape(forma)
+    plan = np.where(observado, plan, np.nan).astype(np.float32).reshape(forma)
+    return chaves, real, plan, dia_fim
+
+
+def _media_janela(hist: np.ndarray, w: int) -> np.ndarray:
+    """Média dos últimos w dias observados de cada série (NaN se nenhum)."""
+    bloco = hist[:, -w:]
+    n = np.sum(~np.isnan(bloco), axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(n > 0, np.nansum(bloco, axis=1) / n, np.nan)
+
+
+def _prever_modelos(hist: np.ndarray, horizonte: int, sazonalidade: int = 7) -> dict:
+    """
+    Previsões (séries x horizonte) de todos os modelos a partir do histórico,
+    vetorizadas sobre as séries (o único laço é sobre os dias, na suavização).
+    """
+    n_series = hist.shape[0]
+    prev = {}
+
+    # naive sazonal: repete a última "semana"; dia faltante usa a média da janela
+    ultima = hist[:, -sazonalidade:]
+    ultima = np.where(np.isnan(ultima), _media_janela(hist, sazonalidade)[:, None], ultima)
+    reps = -(-horizonte // sazonalidade)
+    prev["naive_sazonal"] = np.tile(ultima, (1, reps))[:, :horizonte]
+
+    for w in (7, 28):
+        prev[f"media_movel_{w}"] = np.repeat(_media_janela(hist, w)[:, None], horizonte, axis=1)
+
+    # suavização exponencial simples, todas as séries e alphas de uma vez
+    alphas = np.array([0.1, 0.3, 0.5], dtype=np.float32)[:, None]
+    nivel = np.full((len(alphas), n_series), np.nan, dtype=np.float32)
+    for t in range(hist.shape[1]):
+        y = hist[:, t][None, :]
+        atualizado = np.where(np.isnan(nivel), y, alphas * y + (1 - alphas) * nivel)
+        nivel = np.where(np.isnan(y), nivel, atualizado)
+    for i, a in enumerate(alphas[:, 0]):
+        prev[f"ses_{a:.1f}"] = np.repeat(nivel[i][:, None], horizonte, axis=1)
+
+    return {m: np.maximum(np.nan_to_num(p, nan=0.0), 0) for m, p in prev.items()}
+
+
+def _mape_por_serie(real: np.ndarray, previsto: np.ndarray, plano: np.ndarray) -> tuple:
+    """
+    Erro percentual médio de `previsto` por série, |real - previsto| / plano, só nos dias
+    com real conhecido e plano > 0. Denominador e dias vêm do plano, então todos os
+    modelos e o próprio plano (previsto = plano, a definição do analyze_planning_gap)
+    são medidos nos mesmos dias e na mesma escala. Retorna (mape %, nº de dias avaliados).
+    """
+    valido = ~np.isnan(real) & (plano > 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        erro = np.where(valido, np.abs(real - previsto) / np.where(valido, plano, 1), 0.0)
+        n = valido.sum(axis=1)
+        return np.where(n > 0, erro.sum(axis=1) / n * 100, np.nan), n
+
+
+def prever_demanda_lote(
+    df: pd.DataFrame,
+    horizonte: int = 14,
+    validacao: int = 28,
+    historico: int = 182,
+) -> dict:
+    """
+    Ajusta naive sazonal (7 dias), médias móveis (7/28) e suavização exponencial
+    (alpha 0.1/0.3/0.5) para todas as séries diárias (product_id, local) de uma vez.
+
+    Os últimos `validacao` dias servem de teste: cada modelo prevê esse trecho a partir
+    do histórico anterior e é avaliado pelo erro |real - previsto| / planejado, nos mesmos
+    dias (planejado > 0) e com o mesmo denominador do MAPE do planned_quantity (a
+    definição do gap de planejamento), então as notas são comparáveis entre si. O melhor modelo por série é
+    reajustado com todo o histórico e gera a previsão dos próximos `horizonte` dias.
+    Só os últimos `historico` dias entram na matriz (limita a memória a séries x dias).
+
+    Retorna {"series": avaliação por série, "modelos": resumo por modelo,
+             "previsoes": previsão diária do melhor modelo por série}.
+    """
+    base = _prepare_sales_base(df)
+    chaves, real, plan, dia_fim = _matriz_diaria(base, historico + validacao)
+    if len(chaves) == 0:
+        vazio = pd.DataFrame()
+        return {"series": vazio, "modelos": vazio, "previsoes": vazio}
+
+    teste_real = real[:, -validacao:]
+    teste_plan = np.nan_to_num(plan[:, -validacao:], nan=0.0)
+    mape_plano, dias_plano = _mape_por_serie(teste_real, teste_plan, teste_plan)
+
+    prev_teste = _prever_modelos(real[:, :-validacao], validacao)
+    mapes = np.vstack([_mape_por_serie(teste_real, prev_teste[m], teste_plan)[0] for m in MODELOS_PREVISAO])
+    sem_avaliacao = np.all(np.isnan(mapes), axis=0)
+    melhor = np.argmin(np.where(np.isnan(mapes), np.inf, mapes), axis=0)
+    melhor[sem_avaliacao] = MODELOS_PREVISAO.index("media_movel_28")
+    mape_melhor = mapes[melhor, np.arange(len(chaves))]
+
+    series = chaves.assign(
+        modelo=np.asarray(MODELOS_PREVISAO, dtype=object)[melhor],
+        mape_modelo=mape_melhor,
+        mape_plano=mape_plano,
+        dias_avaliados=dias_plano,
+    )
+    series["ganho_pp"] = series["mape_plano"] - series["mape_modelo"]
+
+    modelos = (
+        series.groupby("modelo")
+        .agg(series=("modelo", "size"), mape_modelo_medio=("mape_modelo", "mean"), mape_plano_medio=("mape_plano", "mean"))
+        .sort_values("series", ascending=False)
+        .reset_index()
+    )
+
+    prev_futuro = _prever_modelos(real, horizonte)
+    escolhida = np.stack([prev_futuro[m] for m in MODELOS_PREVISAO])[melhor, np.arange(len(chaves))]
+    datas = pd.date_range(dia_fim + pd.Timedelta(days=1), periods=horizonte, freq="D")
+    previsoes = pd.DataFrame({
+        "product_id": np.repeat(chaves["product_id"].to_numpy(), horizonte),
+        "local": np.repeat(chaves["local"].to_numpy(), horizonte),
+        "date": np.tile(datas.to_numpy(), len(chaves)),
+        "previsao": escolhida.reshape(-1).astype(float),
+        "modelo": np.repeat(series["modelo"].to_numpy(), horizonte),
+    })
+
+    return {
+        "series": series.sort_values("ganho_pp", ascending=False, ignore_index=True),
+        "modelos": modelos,
+        "previsoes": previsoes,
+    }
+
+
+# =========================
+# 16) Rollups de calendário (dia, semana ISO, mês, ano)
+# =========================
+# Chaves inteiras de período: dia = YYYYMMDD, semana = ano ISO * 100 + semana ISO,
+# mês = YYYYMM, ano = YYYY. Todas incluem o ano, então períodos de anos diferentes
+# nunca se misturam.
+GRANULARIDADES_CALENDARIO = ("dia", "semana", "mes", "ano")
+_METRICAS_ROLLUP = ["volume", "planejado", "receita", "linhas"]
+
+
+def _chave_periodo(dias: pd.Series, granularidade: str) -> np.ndarray:
+    if granularidade == "dia":
+        chave = dias.dt.year * 10000 + dias.dt.month * 100 + dias.dt.day
+    elif granularidade == "semana":
+        iso = dias.dt.isocalendar()
+        chave = iso["year"].astype("int64") * 100 + iso["week"].astype("int64")
+    elif granularidade == "mes":
+        chave = dias.dt.year * 100 + dias.dt.month
+    elif granularidade == "ano":
+        chave = dias.dt.year
+    else:
+        raise ValueError(f"granularidade inválida: {granularidade}. Use: {list(GRANULARIDADES_CALENDARIO)}")
+    return chave.to_numpy(dtype=np.int64)
+
+
+def formatar_periodo(granularidade: str, chave: int) -> str:
+    """20240315 -> '2024-03-15', 202411 (semana) -> '2024-W11', 202403 -> '2024-03', 2024 -> '2024'."""
+    chave = int(chave)
+    if granularidade == "dia":
+        return f"{chave // 10000:04d}-{chave // 100 % 100:02d}-{chave % 100:02d}"
+    if granularidade == "semana":
+        return f"{chave // 100:04d}-W{chave % 100:02d}"
+    if granularidade == "mes":
+        return f"{chave // 100:04d}-{chave % 100:02d}"
+    return f"{chave:04d}"
+
+
+def construir_rollups(
+    df: pd.DataFrame,
+    granularidades: tuple = GRANULARIDADES_CALENDARIO,
+) -> dict:
+    """
+    Tabelas pré-agregadas por período, no total, por product_id e por local:
+    rollups[granularidade]["total" | "product_id" | "local"] com as colunas
+    periodo (chave inteira), [product_id | local], volume, planejado, receita, linhas.
+
+    O dataset é varrido uma única vez (agregado por produto + local + dia); as demais
+    tabelas são reagregações dessa base diária, bem menor que o dataset.
+    """
+    base = _prepare_sales_base(df).dropna(subset=["date"])
+    diario = (
+        base.groupby(["product_id", "local", base["date"].dt.normalize().rename("dia")], observed=True, dropna=False)
+        .agg(
+            volume=("actual_quantity", "sum"),
+            planejado=("planned_quantity", "sum"),
+            receita=("receita", "sum"),
+            linhas=("actual_quantity", "size"),
+        )
+        .reset_index()
+    )
+
+    rollups = {}
+    for gran in granularidades:
+        diario["periodo"] = _chave_periodo(diario["dia"], gran)
+        rollups[gran] = {
+            "total": diario.groupby("periodo")[_METRICAS_ROLLUP].sum().reset_index(),
+            "product_id": diario.groupby(["periodo", "product_id"], observed=True, dropna=False)[_METRICAS_ROLLUP]
+            .sum().reset_index(),
+            "local": diario.groupby(["periodo", "local"], observed=True, dropna=False)[_METRICAS_ROLLUP]
+            .sum().reset_index(),
+        }
+    return rollups
+
+
+def consultar_rollup(
+    rollups: dict,
+    granularidade: str = "mes",
+    product_id: str | None = None,
+    local: str | None = None,
+) -> pd.DataFrame:
+    """Série de um rollup (total, de um produto ou de um local), com o período formatado."""
+    if granularidade not in rollups:
+        raise ValueError(f"granularidade inválida: {granularidade}. Use: {list(rollups)}")
+    if product_id and local:
+        raise ValueError("Informe product_id ou local (não os dois).")
+
+    tabelas = rollups[granularidade]
+    if product_id:
+        out = tabelas["product_id"]
+        out = out[out["product_id"].astype(str) == str(product_id)]
+    elif local:
+        out = tabelas["local"]
+        out = out[out["local"].astype(str) == str(local)]
+    else:
+        out = tabelas["total"]
+
+    out = out.sort_values("periodo")
+    return out.assign(periodo=[formatar_periodo(granularidade, c) for c in out["periodo"]])
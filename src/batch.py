@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+from result_store import store
+from sessao import definir_sessao, selecionar_dataset
+
+# =========================
+# Modo batch: perguntas de um JSONL, respondidas em paralelo
+# =========================
+# Uso: python src/batch.py perguntas.jsonl respostas.jsonl --concorrencia 4
+# Cada linha de entrada: {"id": "...", "pergunta": "..."} ("question" também é aceito),
+# com "dataset" opcional (nome do registro; padrão: dataset padrão).
+# Cada pergunta roda com Context e sessão próprios (sem memória compartilhada).
+# Agente e LLM são importados só dentro das funções: os workers do pool de processos
+# (spawn) reexecutam este módulo e não devem carregar o agente nem o dataset.
+
+
+def ler_perguntas(caminho: str) -> list:
+    perguntas = []
+    with open(caminho, encoding="utf-8") as f:
+        for i, linha in enumerate(f):
+            linha = linha.strip()
+            if not linha:
+                continue
+            item = json.loads(linha)
+            texto = item.get("pergunta") or item.get("question")
+            if not texto:
+                raise ValueError(f"Linha {i + 1} sem campo 'pergunta'.")
+            perguntas.append({"id": str(item.get("id", i + 1)), "pergunta": texto, "dataset": item.get("dataset")})
+    return perguntas
+
+
+async def responder(agent, item: dict, limite: asyncio.Semaphore, max_iterations: int | None) -> dict:
+    from llama_index.core.workflow import Context
+    from agent_runtime import executar_pergunta
+
+    async with limite:
+        definir_sessao(f"batch-{item['id']}")
+        selecionar_dataset(item.get("dataset"))
+        ctx = Context(agent)
+
+        inicio = time.perf_counter()
+        try:
+            orcamento = {"max_iterations": max_iterations} if max_iterations else None
+            resultado = await executar_pergunta(agent, item["pergunta"], ctx, orcamento)
+            erro = None
+        except Exception as e:
+            resultado = {"resposta": None}
+            erro = f"{type(e).__name__}: {e}"
+        finally:
+            store.limpar_sessao()  # a sessão do batch termina aqui: libera os resultados guardados
+
+        return {
+            "id": item["id"],
+            "dataset": item.get("dataset"),
+            "pergunta": item["pergunta"],
+            **resultado,
+            "erro": erro,
+            "duracao_s": round(time.perf_counter() - inicio, 3),
+        }
+
+
+async def executar_batch(entrada: str, saida: str, concorrencia: int = 4, max_iterations: int | None = None) -> dict:
+    """Responde todas as perguntas e grava uma linha por resposta (na ordem em que terminam)."""
+    from agent import get_agent
+
+    perguntas = ler_perguntas(entrada)
+    agent = get_agent()
+    limite = asyncio.Semaphore(max(concorrencia, 1))
+
+    Path(saida).parent.mkdir(parents=True, exist_ok=True)
+    inicio = time.perf_counter()
+    erros = 0
+    with open(saida, "w", encoding="utf-8") as f:
+        tarefas = [asyncio.create_task(responder(agent, item, limite, max_iterations)) for item in perguntas]
+        for tarefa in asyncio.as_completed(tarefas):
+            resultado = await tarefa
+            erros += resultado["erro"] is not None
+            f.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+            f.flush()
+
+    return {"perguntas": len(perguntas), "erros": erros, "duracao_s": round(time.perf_counter() - inicio, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Responde um arquivo JSONL de perguntas em paralelo.")
+    parser.add_argument("entrada", help="JSONL com campos id/pergunta")
+    parser.add_argument("saida", help="JSONL de saída com respostas, ferramentas, tokens e tempos")
+    parser.add_argument("--concorrencia", type=int, default=4)
+    parser.add_argument("--max-iterations", type=int, default=None, help="padrão: AGENT_MAX_ITERATIONS")
+    args = parser.parse_args()
+
+    resumo = asyncio.run(executar_batch(args.entrada, args.saida, args.concorrencia, args.max_iterations))
+    print(json.dumps(resumo, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# =========================
+# Armazenamento colunar em arquivos .npy (memory-mapped)
+# =========================
+# Cada coluna vira um .npy; texto vira códigos inteiros + lista de categorias (ordenada).
+# Abrir com mmap_mode="r" não copia nada: vários processos leem as mesmas páginas
+# do page cache do sistema operacional.
+
+_META = "meta.json"
+
+
+def salvar_colunar(df: pd.DataFrame, diretorio, categoricas=()) -> Path:
+    """
+    Grava o DataFrame como uma coluna .npy por arquivo + meta.json.
+    Colunas em `categoricas` são sempre codificadas (mesmo se numéricas).
+    """
+    destino = Path(diretorio)
+    destino.mkdir(parents=True, exist_ok=True)
+
+    meta = {"linhas": int(len(df)), "colunas": {}}
+    for i, col in enumerate(df.columns):
+        serie = df[col]
+        arquivo = f"c{i}.npy"
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            valores = serie.to_numpy(dtype="datetime64[ns]").view(np.int64)
+            info = {"tipo": "datetime"}
+        elif col not in categoricas and (pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_bool_dtype(serie)):
+            valores = serie.to_numpy()
+            info = {"tipo": "numerico"}
+        else:
+            codigos, categorias = pd.factorize(serie, sort=True, use_na_sentinel=True)
+            valores = codigos.astype(np.int32)
+            info = {"tipo": "categoria", "categorias": categorias.tolist()}
+        np.save(destino / arquivo, np.ascontiguousarray(valores))
+        info["arquivo"] = arquivo
+        meta["colunas"][str(col)] = info
+
+    (destino / _META).write_text(json.dumps(meta, ensure_ascii=False, default=str), encoding="utf-8")
+    return destino
+
+
+def ler_meta(diretorio) -> dict:
+    return json.loads((Path(diretorio) / _META).read_text(encoding="utf-8"))
+
+
+def abrir_arrays(diretorio, colunas=None, meta: dict | None = None) -> dict:
+    """Arrays memory-mapped (somente leitura) das colunas pedidas, sem conversão."""
+    meta = meta or ler_meta(diretorio)
+    nomes = colunas or list(meta["colunas"])
+    return {
+        nome: np.load(Path(diretorio) / meta["colunas"][nome]["arquivo"], mmap_mode="r")
+        for nome in nomes
+    }
+
+
+def abrir_colunar(diretorio, colunas=None, texto: str = "categoria") -> pd.DataFrame:
+    """
+    Reconstrói o DataFrame a partir dos arquivos memory-mapped. Colunas numéricas e de
+    data apontam para o mmap (sem cópia). Texto volta como Categorical (texto="categoria")
+    ou como object (texto="objeto"): um ponteiro por linha para as strings únicas, então
+    cada processo paga 8 bytes/linha em vez de uma string por linha.
+    """
+    meta = ler_meta(diretorio)
+    arrays = abrir_arrays(diretorio, colunas, meta=meta)
+
+    dados = {}
+    for nome, valores in arrays.items():
+        info = meta["colunas"][nome]
+        if info["tipo"] == "datetime":
+            dados[nome] = pd.Series(valores.view("datetime64[ns]"), copy=False)
+        elif info["tipo"] == "categoria" and texto == "objeto":
+            # código -1 (nulo) cai no último elemento, que é NaN
+            categorias = np.asarray([*info["categorias"], np.nan], dtype=object)
+            dados[nome] = pd.Series(categorias[valores], copy=False)
+        elif info["tipo"] == "categoria":
+            dados[nome] = pd.Categorical.from_codes(valores, categories=info["categorias"])
+        else:
+            dados[nome] = pd.Series(valores, copy=False)
+    return pd.DataFrame(dados, copy=False)
@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import columnar
+
+# =========================
+# Registro de datasets nomeados (memory-mapped, compartilhado entre processos)
+# =========================
+# SALES_DATASETS="norte=data/norte.csv;sul=data/sul.csv" registra exports adicionais;
+# o dataset "default" é sempre o SALES_CSV.
+# Cada CSV é convertido uma única vez para o formato colunar (columnar.py) em
+# DATASETS_DIR/<nome>/<assinatura do CSV>/. Enquanto o CSV não muda, qualquer processo
+# (agente, batch, workers) só anexa esses arquivos via mmap: colunas numéricas e datas
+# ficam no page cache do sistema, compartilhadas, sem cópia privada por processo.
+# DATASETS_MMAP=0 volta a ler o CSV direto em memória própria.
+
+DATASET_PADRAO = "default"
+DATASETS_DIR = Path(os.getenv("DATASETS_DIR", "data/.datasets"))
+MMAP_HABILITADO = os.getenv("DATASETS_MMAP", "1") == "1"
+
+_CATEGORICAS = ("product_id", "local", "promotion_type")
+
+
+def _ler_catalogo() -> dict:
+    catalogo = {DATASET_PADRAO: os.getenv("SALES_CSV", "data/sales.csv")}
+    for item in os.getenv("SALES_DATASETS", "").split(";"):
+        if "=" in item:
+            nome, caminho = item.split("=", 1)
+            catalogo[nome.strip()] = caminho.strip()
+    return catalogo
+
+
+_CATALOGO = _ler_catalogo()
+
+
+def registrar(nome: str, caminho: str):
+    """Registra (ou redireciona) um dataset nomeado para um CSV."""
+    _CATALOGO[str(nome)] = str(caminho)
+
+
+def caminho(nome: str) -> str:
+    if nome not in _CATALOGO:
+        raise KeyError(f"Dataset '{nome}' não registrado. Disponíveis: {sorted(_CATALOGO)}")
+    return _CATALOGO[nome]
+
+
+def listar() -> list:
+    return [{"dataset": nome, "csv": csv} for nome, csv in sorted(_CATALOGO.items())]
+
+
+def _assinatura(csv: str) -> str:
+    st = os.stat(csv)
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
+
+def materializar(nome: str, csv: str, leitor) -> Path:
+    """
+    Garante a versão colunar do CSV atual e devolve o diretório. Só converte se o CSV
+    mudou desde a última conversão (por qualquer processo). A conversão é gravada num
+    diretório temporário e renomeada no fim, então ninguém anexa arquivos pela metade.
+    """
+    base = DATASETS_DIR / nome
+    destino = base / _assinatura(csv)
+    if (destino / "meta.json").exists():
+        return destino
+
+    base.mkdir(parents=True, exist_ok=True)
+    temporario = Path(tempfile.mkdtemp(prefix=".tmp-", dir=base))
+    try:
+        dados = leitor(csv)
+        columnar.salvar_colunar(dados, temporario, categoricas=[c for c in _CATEGORICAS if c in dados.columns])
+        os.rename(temporario, destino)
+    except OSError:
+        if not (destino / "meta.json").exists():
+            raise
+        # outro processo terminou a mesma conversão antes
+    finally:
+        shutil.rmtree(temporario, ignore_errors=True)
+
+    # versões antigas: quem ainda as usa mantém o mmap aberto (o SO só libera ao fechar)
+    for antigo in base.iterdir():
+        if antigo != destino and not antigo.name.startswith(".tmp-"):
+            shutil.rmtree(antigo, ignore_errors=True)
+    return destino
+
+
+def abrir(nome: str, leitor, csv: str | None = None):
+    """
+    DataFrame do dataset `nome`: anexado via mmap (padrão) ou lido do CSV (DATASETS_MMAP=0,
+    ou se não for possível gravar em DATASETS_DIR).
+    """
+    csv = csv or caminho(nome)
+    if not MMAP_HABILITADO:
+        return leitor(csv)
+    try:
+        diretorio = materializar(nome, csv, leitor)
+    except OSError as e:
+        print(f"[dataset '{nome}': sem cache colunar ({e}); lendo o CSV em memória]")
+        return leitor(csv)
+    return columnar.abrir_colunar(diretorio, texto="objeto")
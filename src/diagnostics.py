@@ -0,0 +1,99 @@
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+# =========================
+# Diagnóstico de inicialização (tempo de import)
+# =========================
+# Cada módulo é importado em um processo Python novo com `-X importtime`, então o
+# tempo medido é o custo real de um start a frio (sem cache de módulos já carregados).
+# Uso: python src/diagnostics.py
+
+SRC_DIR = Path(__file__).resolve().parent
+
+# caminho de inicialização do chat + módulos pesados que devem ficar fora dele
+MODULOS_PADRAO = [
+    "agent",
+    "agent_tools",
+    "analytics",
+    "pandas",
+    "numpy",
+    "llama_index.core",
+    "llama_index.llms.openai",
+    "openai",
+    "llama_index.experimental.query_engine",
+    "reportlab.platypus",
+    "duckdb",
+]
+
+_LINHA = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def _importtime(modulo: str) -> tuple:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(SRC_DIR), env.get("PYTHONPATH")]))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        capture_output=True, text=True, env=env,
+    )
+    linhas = []
+    for linha in proc.stderr.splitlines():
+        m = _LINHA.match(linha)
+        if m:
+            linhas.append((m.group(4), int(m.group(2)), len(m.group(3))))
+    erro = None
+    if proc.returncode != 0:
+        erro = (proc.stderr.strip().splitlines() or ["erro desconhecido"])[-1]
+    return linhas, erro
+
+
+def medir_importacao(modulo: str) -> dict:
+    """Tempo (s) de `import modulo` em um processo novo, incluindo dependências."""
+    linhas, erro = _importtime(modulo)
+    cumulativo = None if erro else next((us for nome, us, _ in reversed(linhas) if nome == modulo), None)
+    return {
+        "modulo": modulo,
+        "segundos": round(cumulativo / 1e6, 3) if cumulativo is not None else None,
+        "erro": erro,
+    }
+
+
+def maiores_importacoes(modulo: str = "agent", top_n: int = 15) -> list:
+    """Dependências diretas de `modulo` ordenadas pelo custo de import."""
+    linhas, _ = _importtime(modulo)
+    fim = next((i for i in range(len(linhas) - 1, -1, -1) if linhas[i][0] == modulo), None)
+    if fim is None:
+        return []
+
+    # filhos diretos: linhas logo antes do módulo com 2 espaços a mais de indentação
+    nivel = linhas[fim][2]
+    filhos = []
+    for nome, us, n in reversed(linhas[:fim]):
+        if n <= nivel:
+            break
+        if n == nivel + 2:
+            filhos.append((nome, us))
+    filhos.sort(key=lambda par: par[1], reverse=True)
+    return [{"modulo": nome, "segundos": round(us / 1e6, 3)} for nome, us in filhos[:top_n]]
+
+
+def relatorio_importacao(modulos: list | None = None) -> str:
+    out = ["TEMPO DE IMPORTAÇÃO (processo novo, -X importtime)"]
+    for modulo in modulos or MODULOS_PADRAO:
+        r = medir_importacao(modulo)
+        if r["segundos"] is None:
+            out.append(f"- {modulo:<40} indisponível ({r['erro']})")
+        else:
+            out.append(f"- {modulo:<40} {r['segundos']:>7.3f}s")
+
+    out.append("")
+    out.append("Maiores dependências carregadas na inicialização (import agent):")
+    for r in maiores_importacoes("agent"):
+        out.append(f"- {r['modulo']:<40} {r['segundos']:>7.3f}s")
+    return "\n".join(out)
+
+
+if __name__ == "__main__":
+    print(relatorio_importacao(sys.argv[1:] or None))
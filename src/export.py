@@ -0,0 +1,173 @@
+import gzip
+import importlib.util
+import os
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+# =========================
+# Exportação em blocos (CSV / Parquet)
+# =========================
+# O resultado completo de uma tool é gravado bloco a bloco: cada bloco de linhas do
+# dataset passa pela função (linha a linha, sem dependência entre blocos) e vai direto
+# para o arquivo. A memória fica limitada ao tamanho do bloco, sem montar uma string
+# gigante nem uma segunda cópia inteira do resultado.
+# Parquet depende do pyarrow (opcional); CSV sai com sep=";" como o CSV de origem.
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+TAMANHO_BLOCO = int(os.getenv("EXPORT_TAMANHO_BLOCO", "200000"))
+
+FORMATOS = ("csv", "parquet")
+COMPRESSOES = {"csv": (None, "gzip"), "parquet": (None, "snappy", "gzip", "zstd")}
+
+
+def parquet_disponivel() -> bool:
+    """True se o pyarrow (opcional) estiver instalado. Não importa o módulo."""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _sufixo(formato: str, compressao: str | None) -> str:
+    return ".csv.gz" if formato == "csv" and compressao == "gzip" else f".{formato}"
+
+
+def caminho_padrao(nome: str, formato: str, compressao: str | None) -> Path:
+    """Nome único (timestamp + sufixo aleatório): exportações simultâneas não colidem."""
+    return Path(EXPORT_DIR) / f"{nome}_{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}{_sufixo(formato, compressao)}"
+
+
+def resolver_destino(nome_arquivo: str, formato: str, compressao: str | None) -> Path:
+    """
+    Caminho dentro de EXPORT_DIR para um nome de arquivo informado. Só aceita um nome
+    simples (sem diretórios, sem '..'); a extensão do formato é acrescentada se faltar.
+    """
+    nome_arquivo = str(nome_arquivo).strip()
+    if not nome_arquivo or Path(nome_arquivo).name != nome_arquivo or nome_arquivo in (".", ".."):
+        raise ValueError("nome_arquivo deve ser só um nome de arquivo, sem diretórios.")
+    sufixo = _sufixo(formato, compressao)
+    if not nome_arquivo.endswith(sufixo):
+        nome_arquivo += sufixo
+
+    base = Path(EXPORT_DIR).resolve()
+    destino = (base / nome_arquivo).resolve()
+    if destino.parent != base:
+        raise ValueError(f"O arquivo precisa ficar em {EXPORT_DIR}.")
+    return destino
+
+
+def blocos(df: pd.DataFrame, posicoes=None, tamanho: int = TAMANHO_BLOCO):
+    """Fatias de `tamanho` linhas do df (ou só das `posicoes` informadas)."""
+    n = len(df) if posicoes is None else len(posicoes)
+    for inicio in range(0, n, tamanho):
+        if posicoes is None:
+            yield df.iloc[inicio:inicio + tamanho]
+        else:
+            yield df.iloc[posicoes[inicio:inicio + tamanho]]
+
+
+def _gravar_csv(partes, destino: Path, compressao: str | None) -> int:
+    abrir = gzip.open if compressao == "gzip" else open
+    linhas = 0
+    with abrir(destino, "xt", encoding="utf-8", newline="") as f:  # "x": nunca sobrescreve
+        for parte in partes:
+            parte.to_csv(f, sep=";", index=False, header=linhas == 0)
+            linhas += len(parte)
+    return linhas
+
+
+def _coluna_texto(dtype) -> bool:
+    return isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(dtype)
+
+
+def _esquema_parquet(parte: pd.DataFrame):
+    """
+    Schema do arquivo a partir dos dtypes do frame. Colunas texto/categoria viram string:
+    inferido só pelo primeiro bloco, um object todo nulo (ex: promotion_type num bloco
+    sem promoção) viraria tipo null e os blocos seguintes não caberiam no schema.
+    """
+    import pyarrow as pa
+
+    esquema = pa.Schema.from_pandas(parte, preserve_index=False)
+    for i, coluna in enumerate(parte.columns):
+        if _coluna_texto(parte[coluna].dtype):
+            esquema = esquema.set(i, pa.field(str(coluna), pa.string()))
+    return esquema.remove_metadata()  # os metadados pandas ainda descreveriam o tipo inferido
+
+
+def _gravar_parquet(partes, destino: Path, compressao: str | None) -> int:
+    if not parquet_disponivel():
+        raise RuntimeError("Exportar em Parquet requer o pyarrow (pip install pyarrow).")
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    escritor = None
+    arquivo = None
+    linhas = 0
+    try:
+        for parte in partes:
+            if escritor is None:
+                esquema = _esquema_parquet(parte)
+                arquivo = open(destino, "xb")  # "x": nunca sobrescreve
+                escritor = pq.ParquetWriter(arquivo, esquema, compression=compressao or "none")
+            categoricas = {c: object for c in parte.columns if isinstance(parte[c].dtype, pd.CategoricalDtype)}
+            if categoricas:
+                parte = parte.astype(categoricas)
+            tabela = pa.Table.from_pandas(parte, schema=escritor.schema, preserve_index=False)
+            escritor.write_table(tabela)
+            linhas += len(parte)
+    finally:
+        if escritor is not None:
+            escritor.close()
+        if arquivo is not None:
+            arquivo.close()
+    return linhas
+
+
+def exportar_blocos(
+    partes,
+    nome: str,
+    formato: str = "csv",
+    compressao: str | None = None,
+    nome_arquivo: str | None = None,
+) -> dict:
+    """
+    Grava os DataFrames de `partes` (iterável, um por bloco) em um único arquivo novo
+    dentro de EXPORT_DIR (nome_arquivo opcional; arquivo existente não é sobrescrito).
+    Blocos vazios são pulados. Retorna caminho, linhas, bytes e tempo.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"formato inválido: {formato}. Use: {list(FORMATOS)}")
+    if compressao not in COMPRESSOES[formato]:
+        raise ValueError(f"compressao inválida para {formato}: {compressao}. Use: {list(COMPRESSOES[formato])}")
+
+    if nome_arquivo:
+        destino = resolver_destino(nome_arquivo, formato, compressao)
+    else:
+        destino = caminho_padrao(nome, formato, compressao)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    partes = (p for p in partes if len(p))
+
+    inicio = time.perf_counter()
+    try:
+        if formato == "csv":
+            linhas = _gravar_csv(partes, destino, compressao)
+        else:
+            linhas = _gravar_parquet(partes, destino, compressao)
+    except FileExistsError:
+        raise  # o arquivo é de outra exportação: não apaga
+    except BaseException:
+        destino.unlink(missing_ok=True)  # não deixa um arquivo parcial com o nome ocupado
+        raise
+
+    tamanho = destino.stat().st_size if destino.exists() else 0  # Parquet sem linhas não gera arquivo
+    return {
+        "caminho": str(destino),
+        "formato": formato,
+        "compressao": compressao,
+        "linhas": linhas,
+        "bytes": tamanho,
+        "tamanho_mb": round(tamanho / 2**20, 2),
+        "segundos": round(time.perf_counter() - inicio, 3),
+    }
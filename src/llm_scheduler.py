@@ -0,0 +1,403 @@
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict, deque
+
+from sessao import sessao_atual
+
+# =========================
+# Agendador de chamadas ao LLM (compartilhado entre sessões)
+# =========================
+# - Pool de conexões HTTP único (httpx) para todas as sessões.
+# - Token bucket por requisições/min e tokens/min (limites do provedor).
+# - Fila justa: round-robin entre sessões, então uma sessão pesada não trava as outras.
+# - Retentativas com backoff exponencial + jitter (respeita Retry-After) em 429/5xx/timeout.
+# - Métricas de fila (profundidade por sessão, espera, retentativas).
+# - Chamadas síncronas (chat/complete feitos por tools em threads, ex: o PandasQueryEngine)
+#   pedem a vaga à mesma fila, no loop do agendador, e retentam igual às async.
+# Aponte OPENAI_API_BASE para um endpoint local compatível para testar sem o provedor.
+
+CONFIG = {
+    "max_concorrencia": int(os.getenv("LLM_MAX_CONCORRENCIA", "8")),
+    "rpm": float(os.getenv("LLM_RPM", "500")),
+    "tpm": float(os.getenv("LLM_TPM", "200000")),
+    "max_tentativas": int(os.getenv("LLM_MAX_TENTATIVAS", "5")),
+    "backoff_base_s": float(os.getenv("LLM_BACKOFF_BASE_S", "0.5")),
+    "backoff_max_s": float(os.getenv("LLM_BACKOFF_MAX_S", "30")),
+    "tokens_resposta_estimados": int(os.getenv("LLM_TOKENS_RESPOSTA_ESTIMADOS", "512")),
+}
+
+_STATUS_RETENTAVEIS = {408, 409, 429, 500, 502, 503, 504}
+_ERROS_RETENTAVEIS = {"RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError"}
+
+
+class TokenBucket:
+    """Balde que enche `taxa_por_min` unidades por minuto, até `capacidade`."""
+
+    def __init__(self, taxa_por_min: float, capacidade: float | None = None):
+        self.taxa_s = taxa_por_min / 60.0
+        self.capacidade = capacidade or taxa_por_min
+        self.disponivel = self.capacidade
+        self._ultimo = time.monotonic()
+
+    def _repor(self):
+        agora = time.monotonic()
+        self.disponivel = min(self.capacidade, self.disponivel + (agora - self._ultimo) * self.taxa_s)
+        self._ultimo = agora
+
+    def espera_para(self, n: float) -> float:
+        """Segundos até haver `n` unidades (0 se já há)."""
+        self._repor()
+        n = min(n, self.capacidade)
+        if self.disponivel >= n:
+            return 0.0
+        return (n - self.disponivel) / self.taxa_s if self.taxa_s > 0 else float("inf")
+
+    def consumir(self, n: float):
+        self._repor()
+        self.disponivel -= min(n, self.capacidade)
+
+
+def _retentavel(erro: Exception) -> bool:
+    if type(erro).__name__ in _ERROS_RETENTAVEIS:
+        return True
+    status = getattr(erro, "status_code", None) or getattr(getattr(erro, "response", None), "status_code", None)
+    return status in _STATUS_RETENTAVEIS
+
+
+def _no_thread_do_loop(loop) -> bool:
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+def _retry_after(erro: Exception) -> float | None:
+    headers = getattr(getattr(erro, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AgendadorLLM:
+    def __init__(self, config: dict | None = None):
+        self.config = {**CONFIG, **(config or {})}
+        self._rpm = TokenBucket(self.config["rpm"])
+        self._tpm = TokenBucket(self.config["tpm"])
+        self._filas: OrderedDict = OrderedDict()  # sessão -> deque[(future, tokens, enfileirado_em)]
+        self._em_execucao = 0
+        self._timer = None
+        self._loop = None  # loop onde a fila roda (último a usar o agendador)
+        self._stats = {"requisicoes": 0, "retentativas": 0, "falhas": 0, "espera_total_s": 0.0, "espera_max_s": 0.0}
+
+    # ---------- fila justa ----------
+    def _despachar(self):
+        self._timer = None
+        while self._em_execucao < self.config["max_concorrencia"] and self._filas:
+            sessao, fila = next(iter(self._filas.items()))
+            futuro, tokens, enfileirado = fila[0]
+            if futuro.cancelled():
+                fila.popleft()
+                self._rotacionar(sessao, fila)
+                continue
+
+            espera = max(self._rpm.espera_para(1), self._tpm.espera_para(tokens))
+            if espera > 0:
+                self._timer = asyncio.get_running_loop().call_later(espera, self._despachar)
+                return
+
+            fila.popleft()
+            self._rotacionar(sessao, fila)
+            self._rpm.consumir(1)
+            self._tpm.consumir(tokens)
+            self._em_execucao += 1
+
+            esperou = time.monotonic() - enfileirado
+            self._stats["espera_total_s"] += esperou
+            self._stats["espera_max_s"] = max(self._stats["espera_max_s"], esperou)
+            futuro.set_result(None)
+
+    def _rotacionar(self, sessao: str, fila: deque):
+        """Sessão atendida vai para o fim da vez (round-robin); fila vazia sai."""
+        self._filas.pop(sessao, None)
+        if fila:
+            self._filas[sessao] = fila
+
+    async def _adquirir(self, sessao: str, tokens: int):
+        self._loop = asyncio.get_running_loop()
+        futuro = self._loop.create_future()
+        self._filas.setdefault(sessao, deque()).append((futuro, tokens, time.monotonic()))
+        if self._timer is None:
+            self._despachar()
+        try:
+            await futuro
+        except asyncio.CancelledError:
+            # vaga já concedida, mas quem pediu foi cancelado: devolve a vaga
+            if futuro.done() and not futuro.cancelled():
+                self._liberar()
+            raise
+
+    def _liberar(self):
+        self._em_execucao -= 1
+        if self._timer is None:
+            self._despachar()
+
+    def _adquirir_sync(self, sessao: str, tokens: int):
+        """
+        Pede a vaga à fila a partir de outra thread e bloqueia até recebê-la. Retorna o
+        loop da fila, ou None se não há loop ativo (ou se a chamada vem do próprio loop,
+        que não pode ser bloqueado): nesse caso a chamada só ganha as retentativas.
+        """
+        loop = self._loop
+        if loop is None or not loop.is_running() or _no_thread_do_loop(loop):
+            return None
+        asyncio.run_coroutine_threadsafe(self._adquirir(sessao, tokens), loop).result()
+        return loop
+
+    def _liberar_sync(self, loop):
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._liberar)
+
+    def _espera_retentativa(self, tentativa: int, erro: Exception) -> float:
+        self._stats["retentativas"] += 1
+        espera = _retry_after(erro)
+        if espera is None:
+            espera = min(self.config["backoff_max_s"], self.config["backoff_base_s"] * 2 ** tentativa)
+            espera *= 0.5 + random.random()  # jitter
+        return espera
+
+    async def _aguardar_retentativa(self, tentativa: int, erro: Exception):
+        await asyncio.sleep(self._espera_retentativa(tentativa, erro))
+
+    # ---------- execução ----------
+    async def executar(self, fabrica, tokens: int, sessao: str | None = None):
+        """Executa `await fabrica()` respeitando fila, limites e retentativas."""
+        sessao = sessao or sessao_atual()
+        for tentativa in range(self.config["max_tentativas"]):
+            await self._adquirir(sessao, tokens)
+            self._stats["requisicoes"] += 1
+            try:
+                return await fabrica()
+            except Exception as e:
+                if not _retentavel(e) or tentativa == self.config["max_tentativas"] - 1:
+                    self._stats["falhas"] += 1
+                    raise
+                erro = e
+            finally:
+                self._liberar()
+            await self._aguardar_retentativa(tentativa, erro)
+
+    async def executar_stream(self, fabrica, tokens: int, sessao: str | None = None):
+        """
+        Versão para streaming: a vaga fica ocupada até o fim do stream. Só retenta se
+        o erro acontecer antes do primeiro pedaço (nada foi entregue ainda).
+        """
+        sessao = sessao or sessao_atual()
+        for tentativa in range(self.config["max_tentativas"]):
+            await self._adquirir(sessao, tokens)
+            self._stats["requisicoes"] += 1
+            entregou = False
+            try:
+                stream = await fabrica()
+                async for pedaco in stream:
+                    entregou = True
+                    yield pedaco
+                return
+            except Exception as e:
+                if entregou or not _retentavel(e) or tentativa == self.config["max_tentativas"] - 1:
+                    self._stats["falhas"] += 1
+                    raise
+                erro = e
+            finally:
+                self._liberar()
+            await self._aguardar_retentativa(tentativa, erro)
+
+    def executar_sync(self, fabrica, tokens: int, sessao: str | None = None):
+        """Versão síncrona de executar: `fabrica()` roda na thread de quem chamou."""
+        sessao = sessao or sessao_atual()
+        for tentativa in range(self.config["max_tentativas"]):
+            loop = self._adquirir_sync(sessao, tokens)
+            self._stats["requisicoes"] += 1
+            try:
+                return fabrica()
+            except Exception as e:
+                if not _retentavel(e) or tentativa == self.config["max_tentativas"] - 1:
+                    self._stats["falhas"] += 1
+                    raise
+                erro = e
+            finally:
+                self._liberar_sync(loop)
+            time.sleep(self._espera_retentativa(tentativa, erro))
+
+    def executar_stream_sync(self, fabrica, tokens: int, sessao: str | None = None):
+        """Versão síncrona de executar_stream (gerador)."""
+        sessao = sessao or sessao_atual()
+        for tentativa in range(self.config["max_tentativas"]):
+            loop = self._adquirir_sync(sessao, tokens)
+            self._stats["requisicoes"] += 1
+            entregou = False
+            try:
+                for pedaco in fabrica():
+                    entregou = True
+                    yield pedaco
+                return
+            except Exception as e:
+                if entregou or not _retentavel(e) or tentativa == self.config["max_tentativas"] - 1:
+                    self._stats["falhas"] += 1
+                    raise
+                erro = e
+            finally:
+                self._liberar_sync(loop)
+            time.sleep(self._espera_retentativa(tentativa, erro))
+
+    def metricas(self) -> dict:
+        fila_por_sessao = {s: len(f) for s, f in self._filas.items()}
+        atendidas = self._stats["requisicoes"]
+        return {
+            "em_execucao": self._em_execucao,
+            "fila_total": sum(fila_por_sessao.values()),
+            "fila_por_sessao": fila_por_sessao,
+            "requisicoes": atendidas,
+            "retentativas": self._stats["retentativas"],
+            "falhas": self._stats["falhas"],
+            "espera_media_s": round(self._stats["espera_total_s"] / atendidas, 4) if atendidas else 0.0,
+            "espera_max_s": round(self._stats["espera_max_s"], 4),
+        }
+
+
+agendador = AgendadorLLM()
+
+
+def estimar_tokens(mensagens) -> int:
+    """Tokens do prompt (~4 chars/token) + resposta estimada, para o balde de TPM."""
+    texto = sum(len(str(getattr(m, "content", m) or "")) for m in mensagens)
+    return texto // 4 + CONFIG["tokens_resposta_estimados"]
+
+
+# =========================
+# LLM OpenAI (LlamaIndex) passando pelo agendador
+# =========================
+_classe_llm = None
+_clientes_http = None
+
+
+def _http_clients():
+    """Um único pool de conexões (sync + async) para todas as sessões."""
+    global _clientes_http
+    if _clientes_http is None:
+        import httpx
+
+        limites = httpx.Limits(
+            max_connections=CONFIG["max_concorrencia"] * 2,
+            max_keepalive_connections=CONFIG["max_concorrencia"],
+        )
+        _clientes_http = (
+            httpx.Client(limits=limites, timeout=60.0),
+            httpx.AsyncClient(limits=limites, timeout=60.0),
+        )
+    return _clientes_http
+
+
+def _get_classe_llm():
+    global _classe_llm
+    if _classe_llm is None:
+        from llama_index.llms.openai import OpenAI
+
+        class OpenAIAgendado(OpenAI):
+            """OpenAI do LlamaIndex cujas chamadas (sync e async) passam pelo agendador."""
+
+            def chat(self, messages, **kwargs):
+                return agendador.executar_sync(
+                    lambda: OpenAI.chat(self, messages, **kwargs), estimar_tokens(messages)
+                )
+
+            def complete(self, prompt, formatted: bool = False, **kwargs):
+                return agendador.executar_sync(
+                    lambda: OpenAI.complete(self, prompt, formatted=formatted, **kwargs), estimar_tokens([prompt])
+                )
+
+            def stream_chat(self, messages, **kwargs):
+                return agendador.executar_stream_sync(
+                    lambda: OpenAI.stream_chat(self, messages, **kwargs), estimar_tokens(messages)
+                )
+
+            def stream_complete(self, prompt, formatted: bool = False, **kwargs):
+                return agendador.executar_stream_sync(
+                    lambda: OpenAI.stream_complete(self, prompt, formatted=formatted, **kwargs),
+                    estimar_tokens([prompt]),
+                )
+
+            async def achat(self, messages, **kwargs):
+                return await agendador.executar(
+                    lambda: OpenAI.achat(self, messages, **kwargs), estimar_tokens(messages)
+                )
+
+            async def acomplete(self, prompt, formatted: bool = False, **kwargs):
+                return await agendador.executar(
+                    lambda: OpenAI.acomplete(self, prompt, formatted=formatted, **kwargs), estimar_tokens([prompt])
+                )
+
+            async def astream_chat(self, messages, **kwargs):
+                return agendador.executar_stream(
+                    lambda: OpenAI.astream_chat(self, messages, **kwargs), estimar_tokens(messages)
+                )
+
+            async def astream_complete(self, prompt, formatted: bool = False, **kwargs):
+                return agendador.executar_stream(
+                    lambda: OpenAI.astream_complete(self, prompt, formatted=formatted, **kwargs),
+                    estimar_tokens([prompt]),
+                )
+
+        _classe_llm = OpenAIAgendado
+    return _classe_llm
+
+
+def criar_llm(**kwargs):
+    """
+    Cria o LLM OpenAI com pool HTTP compartilhado e agendamento. As retentativas do
+    cliente OpenAI são desligadas (max_retries=0): quem retenta é o agendador, tanto
+    nas chamadas async quanto nas síncronas (chat/complete/stream_*; predict usa estas).
+    OPENAI_API_BASE permite apontar para um endpoint local compatível.
+    """
+    http_client, async_http_client = _http_clients()
+    if os.getenv("OPENAI_API_BASE"):
+        kwargs.setdefault("api_base", os.getenv("OPENAI_API_BASE"))
+    return _get_classe_llm()(
+        max_retries=0,
+        http_client=http_client,
+        async_http_client=async_http_client,
+        **kwargs,
+    )
+
+
+# =========================
+# Teste de carga contra um endpoint (ex: stand-in local)
+# =========================
+async def _teste_carga(sessoes: int, por_sessao: int, model: str):
+    from llama_index.core.llms import ChatMessage
+    from sessao import definir_sessao
+
+    llm = criar_llm(model=model, api_key=os.getenv("OPENAI_API_KEY", "teste"))
+
+    async def _sessao(i: int):
+        definir_sessao(f"carga-{i}")
+        for j in range(por_sessao):
+            await llm.achat([ChatMessage(role="user", content=f"ping {i}-{j}")])
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(_sessao(i) for i in range(sessoes)), return_exceptions=True)
+    return {"duracao_s": round(time.perf_counter() - inicio, 3), **agendador.metricas()}
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Dispara chamadas concorrentes pelo agendador e mostra as métricas.")
+    parser.add_argument("--sessoes", type=int, default=4)
+    parser.add_argument("--por-sessao", type=int, default=5)
+    parser.add_argument("--model", default="gpt-4o-mini")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(_teste_carga(args.sessoes, args.por_sessao, args.model)), ensure_ascii=False))
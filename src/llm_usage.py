@@ -0,0 +1,114 @@
+import contextvars
+import threading
+
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events.llm import LLMChatEndEvent, LLMCompletionEndEvent
+
+# =========================
+# Contagem de tokens por pergunta
+# =========================
+# Um handler de instrumentação do LlamaIndex soma os tokens de cada chamada ao LLM
+# no contador do contexto atual (contextvar). Como cada pergunta roda em sua própria
+# task, perguntas concorrentes não misturam as contagens.
+
+USO_ATUAL = contextvars.ContextVar("uso_llm_atual", default=None)
+
+
+class UsoLLM:
+    def __init__(self):
+        self.chamadas = 0
+        self.tokens_prompt = 0
+        self.tokens_resposta = 0
+        self._lock = threading.Lock()
+
+    def registrar(self, tokens_prompt: int, tokens_resposta: int):
+        with self._lock:
+            self.chamadas += 1
+            self.tokens_prompt += tokens_prompt
+            self.tokens_resposta += tokens_resposta
+
+    @property
+    def tokens_total(self) -> int:
+        return self.tokens_prompt + self.tokens_resposta
+
+    def to_dict(self) -> dict:
+        return {
+            "chamadas_llm": self.chamadas,
+            "tokens_prompt": self.tokens_prompt,
+            "tokens_resposta": self.tokens_resposta,
+            "tokens_total": self.tokens_total,
+        }
+
+
+_encoding = None
+
+
+def contar_tokens(texto: str) -> int:
+    """Tokens via tiktoken (o200k_base, usado pelo gpt-4o); sem tiktoken, estima ~4 chars/token."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(texto or "", disallowed_special=()))
+    return len(texto or "") // 4
+
+
+def _usage_bruto(response) -> dict:
+    raw = getattr(response, "raw", None)
+    usage = raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None)
+    if usage is None:
+        return {}
+    if not isinstance(usage, dict):
+        usage = {"prompt_tokens": getattr(usage, "prompt_tokens", None),
+                 "completion_tokens": getattr(usage, "completion_tokens", None)}
+    return usage if usage.get("prompt_tokens") is not None else {}
+
+
+class ContadorTokens(BaseEventHandler):
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContadorTokens"
+
+    def handle(self, event, **kwargs):
+        if not isinstance(event, (LLMChatEndEvent, LLMCompletionEndEvent)):
+            return
+        uso = USO_ATUAL.get()
+        if uso is None or event.response is None:
+            return
+
+        usage = _usage_bruto(event.response)
+        if usage:
+            uso.registrar(int(usage["prompt_tokens"]), int(usage.get("completion_tokens") or 0))
+            return
+
+        if isinstance(event, LLMChatEndEvent):
+            prompt = "\n".join(str(m.content or "") for m in event.messages)
+            resposta = str(event.response.message.content or "")
+        else:
+            prompt = event.prompt
+            resposta = event.response.text
+        uso.registrar(contar_tokens(prompt), contar_tokens(resposta))
+
+
+_instalado = False
+
+
+def instalar():
+    """Registra o contador no dispatcher raiz (idempotente)."""
+    global _instalado
+    if not _instalado:
+        get_dispatcher().add_event_handler(ContadorTokens())
+        _instalado = True
+
+
+def iniciar_contagem() -> UsoLLM:
+    """Cria um contador novo para o contexto atual e o retorna."""
+    instalar()
+    uso = UsoLLM()
+    USO_ATUAL.set(uso)
+    return uso
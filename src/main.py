@@ -1,25 +1,33 @@
 import asyncio
-from llama_index.core.workflow import Context
-from agent import get_agent
+import os
 
-agent = get_agent()
+# agente, LLM e dataset são importados só dentro das funções: os workers do pool de
+# processos (spawn) reexecutam este módulo e não devem carregar nada disso.
+_agent = None
+_ctx = None
+
+
+def _obter_agente():
+    """Cria o agente (e o cliente do LLM) só na primeira pergunta."""
+    global _agent, _ctx
+    if _agent is None:
+        from llama_index.core.workflow import Context
+        from agent import get_agent
+
+        _agent = get_agent()
+        _ctx = Context(_agent)
+    return _agent, _ctx
 
-ctx = Context(agent)
 
 async def ask(pergunta: str) -> str:
-    handler = agent.run(
-        pergunta,
-        ctx=ctx,
-        max_iterations=60,
-        early_stopping_method="generate",
-    )  
-    response = await handler
-            
-    return str(response)
-
-print(" Chat iniciado! Digite 'sair' para encerrar.\n")
+    from agent_runtime import executar_pergunta
+
+    agent, ctx = _obter_agente()
+    resultado = await executar_pergunta(agent, pergunta, ctx)
+    return resultado["resposta"]
 
 async def main_loop():
+    print(" Chat iniciado! Digite 'sair' para encerrar.\n")
     while True:
         pergunta = input("Você: ").strip()
 
@@ -30,6 +38,25 @@ async def main_loop():
         if not pergunta:
             continue
 
+        if pergunta.lower() == "recarregar":
+            import analytics
+
+            print(f"\nDataset recarregado: {analytics.recarregar_dataset()}\n")
+            continue
+
+        if pergunta.lower().startswith("dataset "):
+            import analytics
+            from sessao import selecionar_dataset
+
+            nome = pergunta.split(maxsplit=1)[1].strip()
+            try:
+                analytics.snapshot(nome)
+                selecionar_dataset(nome)
+                print(f"\nDataset em uso: {nome}\n")
+            except KeyError as e:
+                print(f"\n{e}\n")
+            continue
+
         try:
             resposta = await ask(pergunta)
             print(f"\nGPT: {resposta}\n")
@@ -37,6 +64,12 @@ async def main_loop():
             print(f"\nErro ao processar pergunta: {e}\n")
 
 if __name__ == "__main__":
+    # SALES_WATCH_INTERVAL=<segundos> recarrega o dataset automaticamente quando o CSV muda
+    if os.getenv("SALES_WATCH_INTERVAL"):
+        import analytics
+
+        analytics.iniciar_monitoramento(intervalo=float(os.getenv("SALES_WATCH_INTERVAL")))
+
     try:
         asyncio.run(main_loop())
     except RuntimeError:
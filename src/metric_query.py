@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+
+import analytics as t
+
+# =========================
+# Consulta declarativa de métricas
+# =========================
+# Uma especificação (dimensões, medidas, filtros, ordenação, top-k) vira um único
+# groupby sobre o dataset, sem LLM e sem eval de código gerado. Os filtros são os
+# mesmos das demais tools (período, locais, produtos, tipos de promoção), resolvidos
+# pelos índices de analytics.construir_indice_filtros.
+
+# dimensão -> (construtor da chave de agrupamento, formatador aplicado no resultado)
+DIMENSOES = {
+    "product_id": (lambda base: base["product_id"], None),
+    "local": (lambda base: base["local"], None),
+    "promotion_type": (lambda base: base["promotion_type"].fillna("Sem Promo"), None),
+    "promo_flag": (
+        lambda base: base["promotion_type"].notna(),
+        lambda s: s.map({True: "Com Promo", False: "Sem Promo"}),
+    ),
+    # chaves inteiras (AAAAMM) agrupam bem mais rápido que strings/objetos date
+    "mes": (
+        lambda base: base["date"].dt.year * 100 + base["date"].dt.month,
+        lambda s: s.map(lambda v: f"{int(v) // 100:04d}-{int(v) % 100:02d}"),
+    ),
+    "dia": (lambda base: base["date"].dt.normalize(), lambda s: s.dt.strftime("%Y-%m-%d")),
+}
+
+# medida -> (coluna de trabalho, agregação)
+MEDIDAS = {
+    "volume": ("actual_quantity", "sum"),
+    "volume_planejado": ("planned_quantity", "sum"),
+    "receita": ("_receita", "sum"),
+    "gap": ("_gap", "sum"),
+    "mape": ("_abs_gap_pct", "mean"),
+    "nivel_servico": ("service_level", "mean"),
+    "preco_medio": ("actual_price", "mean"),
+    "linhas": ("actual_quantity", "size"),
+    "produtos_distintos": ("product_id", "nunique"),
+}
+
+def consultar_metricas(
+    df: pd.DataFrame,
+    dimensoes: list | None = None,
+    medidas: list | None = None,
+    data_inicio: str | None = None,
+    data_fim: str | None = None,
+    locais: list | None = None,
+    produtos: list | None = None,
+    tipos_promocao: list | None = None,
+    ordenar_por: str | None = None,
+    ascendente: bool = False,
+    top_k: int | None = None,
+    indice: dict | None = None,
+) -> pd.DataFrame:
+    """
+    Executa uma consulta estruturada: filtra, agrupa por `dimensoes` e calcula `medidas`
+    em um único groupby. MAPE segue a mesma regra de analyze_planning_gap
+    (só linhas com planned_quantity > 0, em %).
+    Filtros com a mesma semântica de analytics.mascara_filtros (data_fim inclui o dia
+    inteiro; 'Sem Promo' = sem promoção). `indice`: índice de filtros já calculado
+    para este df (senão é montado na hora, se houver filtro).
+    """
+    dimensoes = list(dimensoes or [])
+    medidas = list(medidas or ["volume"])
+
+    invalidas = [d for d in dimensoes if d not in DIMENSOES]
+    if invalidas:
+        raise ValueError(f"Dimensões inválidas: {invalidas}. Use: {list(DIMENSOES)}")
+    invalidas = [m for m in medidas if m not in MEDIDAS]
+    if invalidas:
+        raise ValueError(f"Medidas inválidas: {invalidas}. Use: {list(MEDIDAS)}")
+    if ordenar_por and ordenar_por not in medidas and ordenar_por not in dimensoes:
+        raise ValueError(f"ordenar_por deve ser uma das dimensões/medidas pedidas: {dimensoes + medidas}")
+
+    filtro = {
+        "data_inicio": data_inicio, "data_fim": data_fim,
+        "locais": locais, "produtos": produtos, "tipos_promocao": tipos_promocao,
+    }
+    mask = None
+    if any(filtro.values()):
+        mask = t.mascara_filtros(indice or t.construir_indice_filtros(df), **filtro)
+    base = df[mask] if mask is not None else df
+
+    # monta só as colunas necessárias (evita copiar o dataset inteiro)
+    trabalho = {}
+    for d in dimensoes:
+        trabalho[d] = DIMENSOES[d][0](base).to_numpy()
+    if not dimensoes:
+        trabalho["_todos"] = np.zeros(len(base), dtype=np.int8)
+
+    for m in medidas:
+        col = MEDIDAS[m][0]
+        if col in trabalho:
+            continue
+        if col == "_receita":
+            trabalho[col] = (base["actual_quantity"].fillna(0) * base["actual_price"].fillna(0)).to_numpy()
+        elif col == "_gap":
+            trabalho[col] = (base["actual_quantity"].fillna(0) - base["planned_quantity"].fillna(0)).to_numpy()
+        elif col == "_abs_gap_pct":
+            plan = base["planned_quantity"].to_numpy(dtype=float)
+            real = base["actual_quantity"].to_numpy(dtype=float)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                trabalho[col] = np.where(plan > 0, np.abs(real - plan) / plan, np.nan)
+        else:
+            trabalho[col] = base[col].to_numpy()
+
+    chaves = dimensoes or ["_todos"]
+    agg = {m: MEDIDAS[m] for m in medidas}
+    out = (
+        pd.DataFrame(trabalho)
+        .groupby(chaves, sort=False, observed=True, dropna=False)
+        .agg(**agg)
+        .reset_index()
+    )
+
+    if "mape" in out.columns:
+        out["mape"] = out["mape"] * 100
+    if not dimensoes:
+        out = out.drop(columns="_todos")
+
+    if ordenar_por:
+        out = out.sort_values(ordenar_por, ascending=ascendente)
+    elif medidas:
+        out = out.sort_values(medidas[0], ascending=ascendente)
+    if top_k:
+        out = out.head(int(top_k))
+
+    # formatação só no resultado agregado (pequeno)
+    for d in dimensoes:
+        fmt = DIMENSOES[d][1]
+        if fmt is not None:
+            out[d] = fmt(out[d])
+
+    return out.reset_index(drop=True)
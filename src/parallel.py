@@ -0,0 +1,164 @@
+import atexit
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import columnar
+
+# =========================
+# Map-reduce multi-core sobre partições por local
+# =========================
+# O dataset é ordenado por local e gravado em formato colunar memory-mapped; cada
+# partição é um intervalo contíguo de linhas (locais inteiros). Os workers abrem os
+# arquivos com mmap (sem cópia, sem pickle dos dados), calculam agregados parciais
+# (map) e o processo principal combina os parciais (reduce).
+# Ativação: ANALYTICS_WORKERS=<n> (ou "auto" = nº de CPUs). 0 / vazio = desativado.
+#
+# Este módulo não importa analytics no topo: os workers (spawn) não devem ler o CSV.
+
+_COLUNAS = ["local", "product_id", "actual_quantity", "actual_price", "service_level"]
+
+
+def n_workers() -> int:
+    valor = os.getenv("ANALYTICS_WORKERS", "").strip().lower()
+    if valor == "auto":
+        return os.cpu_count() or 1
+    return int(valor) if valor.isdigit() else 0
+
+
+def habilitado() -> bool:
+    return n_workers() > 1
+
+
+_executor = None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: não herda threads/estado do processo do agente (fork + threads é frágil)
+        _executor = ProcessPoolExecutor(max_workers=n_workers(), mp_context=multiprocessing.get_context("spawn"))
+        atexit.register(_executor.shutdown, wait=False, cancel_futures=True)
+    return _executor
+
+
+# =========================
+# Preparação das partições
+# =========================
+def preparar_particoes(df, n_particoes: int | None = None) -> dict:
+    """
+    Ordena por local, grava em disco (colunar/mmap) e divide em ~n_particoes intervalos
+    contíguos de tamanho parecido, sem quebrar um local entre partições.
+    """
+    base = df[_COLUNAS].sort_values("local", kind="stable")
+    diretorio = tempfile.mkdtemp(prefix="sales_particoes_")
+    atexit.register(shutil.rmtree, diretorio, True)
+    columnar.salvar_colunar(base.reset_index(drop=True), diretorio, categoricas=("local", "product_id"))
+    meta = columnar.ler_meta(diretorio)
+
+    locais = columnar.abrir_arrays(diretorio, ["local"], meta=meta)["local"]
+    n = len(locais)
+    inicios_local = np.flatnonzero(np.r_[True, locais[1:] != locais[:-1]]) if n else np.array([], dtype=int)
+
+    n_particoes = n_particoes or max(n_workers(), 1) * 4
+    alvo = max(n // n_particoes, 1)
+    cortes = [0]
+    for inicio in inicios_local[1:]:
+        if inicio - cortes[-1] >= alvo:
+            cortes.append(int(inicio))
+    cortes.append(n)
+
+    return {
+        "diretorio": diretorio,
+        "intervalos": list(zip(cortes[:-1], cortes[1:])),
+        "locais": meta["colunas"]["local"]["categorias"],
+        "produtos": meta["colunas"]["product_id"]["categorias"],
+    }
+
+
+def liberar_particoes(part: dict):
+    """Apaga o diretório das partições de uma versão que saiu do cache."""
+    shutil.rmtree(part["diretorio"], ignore_errors=True)
+
+
+def _particoes():
+    import analytics as t
+
+    return t.cache_por_versao("particoes_por_local", preparar_particoes, liberar=liberar_particoes)
+
+
+# =========================
+# Funções map (rodam nos workers)
+# =========================
+def _soma_por_chave(chaves: np.ndarray, valores: np.ndarray) -> tuple:
+    uniq, inv = np.unique(chaves, return_inverse=True)
+    return uniq, np.bincount(inv, weights=valores, minlength=len(uniq))
+
+
+def _map_receita_local(diretorio, inicio, fim, n_locais):
+    c = columnar.abrir_arrays(diretorio, ["local", "actual_quantity", "actual_price"])
+    loc = np.asarray(c["local"][inicio:fim])
+    q = np.nan_to_num(np.asarray(c["actual_quantity"][inicio:fim], dtype=float))
+    p = np.nan_to_num(np.asarray(c["actual_price"][inicio:fim], dtype=float))
+    ok = loc >= 0
+    return np.bincount(loc[ok], weights=(q * p)[ok], minlength=n_locais)
+
+
+def _map_servico_local_produto(diretorio, inicio, fim, n_produtos):
+    c = columnar.abrir_arrays(diretorio, ["local", "product_id", "service_level"])
+    loc = np.asarray(c["local"][inicio:fim], dtype=np.int64)
+    prod = np.asarray(c["product_id"][inicio:fim], dtype=np.int64)
+    sl = np.asarray(c["service_level"][inicio:fim], dtype=float)
+    ok = (loc >= 0) & (prod >= 0) & ~np.isnan(sl)
+    chaves = loc[ok] * n_produtos + prod[ok]
+    uniq, soma = _soma_por_chave(chaves, sl[ok])
+    _, contagem = _soma_por_chave(chaves, np.ones(ok.sum()))
+    return uniq, soma, contagem
+
+
+def _executar(fn, particoes: dict, *args) -> list:
+    ex = _get_executor()
+    futuros = [ex.submit(fn, particoes["diretorio"], i, f, *args) for i, f in particoes["intervalos"]]
+    return [f.result() for f in futuros]
+
+
+def _reduzir_por_chave(parciais: list) -> tuple:
+    chaves = np.concatenate([p[0] for p in parciais])
+    uniq, inv = np.unique(chaves, return_inverse=True)
+    somas = [np.bincount(inv, weights=np.concatenate([p[k] for p in parciais]), minlength=len(uniq))
+             for k in range(1, len(parciais[0]))]
+    return (uniq, *somas)
+
+
+# =========================
+# Analytics paralelos (mesmo formato de saída das versões em analytics.py)
+# =========================
+def ranking_receita_por_local():
+    """Equivalente paralelo de analytics.ranking_receita_por_local(df)."""
+    part = _particoes()
+    total = np.sum(_executar(_map_receita_local, part, len(part["locais"])), axis=0)
+    return (
+        pd.Series(total, index=pd.Index(part["locais"], name="local"), name="receita_real")
+        .sort_values(ascending=False)
+    )
+
+
+def check_service_risk(threshold: float = 0.85) -> dict:
+    """Equivalente paralelo de analytics.check_service_risk(df, threshold)."""
+    part = _particoes()
+    n_produtos = len(part["produtos"])
+    chaves, soma, contagem = _reduzir_por_chave(_executar(_map_servico_local_produto, part, n_produtos))
+    medias = soma / contagem
+    idx = pd.MultiIndex.from_arrays(
+        [np.asarray(part["locais"], dtype=object)[chaves // n_produtos],
+         np.asarray(part["produtos"], dtype=object)[chaves % n_produtos]],
+        names=["local", "product_id"],
+    )
+    serie = pd.Series(medias, index=idx).sort_values()
+    return serie[serie < threshold].to_dict()
+
@@ -0,0 +1,193 @@
+import itertools
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from sessao import sessao_atual
+
+# =========================
+# Resultados de tools por sessão (handles)
+# =========================
+# Frames grandes devolvidos pelas tools ficam guardados com um id (ex: r3), para que
+# perguntas de acompanhamento filtrem/ordenem/agreguem o resultado anterior em vez de
+# recalcular tudo a partir do dataset. Limite de memória por sessão e limite global
+# somando todas as sessões (LRU entre sessões; sessões que ficam vazias são removidas).
+# Um resultado que sozinho passa de um dos limites não é guardado (fica sem id).
+
+LIMITE_MB_SESSAO = float(os.getenv("RESULT_STORE_MAX_MB", "256"))
+LIMITE_MB_TOTAL = float(os.getenv("RESULT_STORE_MAX_MB_TOTAL", "1024"))
+MAX_RESULTADOS_SESSAO = int(os.getenv("RESULT_STORE_MAX_ITENS", "50"))
+
+OPERADORES = ("==", "!=", ">", ">=", "<", "<=", "contem", "em")
+
+
+class ResultStore:
+    def __init__(self, limite_bytes: int, max_itens: int, limite_total_bytes: int | None = None):
+        self.limite_bytes = limite_bytes
+        self.max_itens = max_itens
+        self.limite_total_bytes = limite_total_bytes
+        self._sessoes: dict = {}
+        self._ordem: OrderedDict = OrderedDict()  # (sessão, id) -> bytes, do menos para o mais usado
+        self._total_bytes = 0
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def cabe(self, tamanho: int) -> bool:
+        """True se um resultado de `tamanho` bytes cabe sozinho nos limites."""
+        return tamanho <= self.limite_bytes and (not self.limite_total_bytes or tamanho <= self.limite_total_bytes)
+
+    def salvar(self, df: pd.DataFrame, descricao: str = "") -> str | None:
+        """
+        Guarda o frame na sessão atual e retorna o id do resultado. Retorna None (sem
+        guardar) se o frame sozinho passa do limite por sessão ou do limite global.
+        """
+        tamanho = int(df.memory_usage(deep=True).sum())
+        if not self.cabe(tamanho):
+            return None
+        with self._lock:
+            rid = f"r{next(self._seq)}"
+            sessao = sessao_atual()
+            itens = self._sessoes.setdefault(sessao, OrderedDict())
+            itens[rid] = {"df": df, "bytes": tamanho, "descricao": descricao}
+            self._ordem[(sessao, rid)] = tamanho
+            self._total_bytes += tamanho
+
+            # descarta os menos usados até caber no limite (o recém-criado cabe sozinho)
+            usados = sum(i["bytes"] for i in itens.values())
+            while len(itens) > 1 and (usados > self.limite_bytes or len(itens) > self.max_itens):
+                antigo = next(iter(itens))
+                usados -= self._remover(sessao, antigo)
+
+            # limite global: descarta os menos usados de qualquer sessão
+            while self.limite_total_bytes and len(self._ordem) > 1 and self._total_bytes > self.limite_total_bytes:
+                self._remover(*next(iter(self._ordem)))
+        return rid
+
+    def _remover(self, sessao: str, rid: str) -> int:
+        """Remove um resultado (com o lock já adquirido). Retorna os bytes liberados."""
+        itens = self._sessoes[sessao]
+        tamanho = itens.pop(rid)["bytes"]
+        self._ordem.pop((sessao, rid), None)
+        self._total_bytes -= tamanho
+        if not itens:
+            del self._sessoes[sessao]
+        return tamanho
+
+    def obter(self, rid: str) -> pd.DataFrame:
+        with self._lock:
+            itens = self._sessoes.get(sessao_atual(), {})
+            if rid not in itens:
+                raise KeyError(f"Resultado '{rid}' não encontrado (expirado ou de outra sessão).")
+            itens.move_to_end(rid)
+            self._ordem.move_to_end((sessao_atual(), rid))
+            return itens[rid]["df"]
+
+    def listar(self) -> list:
+        with self._lock:
+            itens = self._sessoes.get(sessao_atual(), {})
+            return [
+                {"resultado_id": rid, "linhas": len(i["df"]), "colunas": list(i["df"].columns),
+                 "descricao": i["descricao"]}
+                for rid, i in itens.items()
+            ]
+
+    def limpar_sessao(self):
+        with self._lock:
+            sessao = sessao_atual()
+            for rid in list(self._sessoes.get(sessao, {})):
+                self._remover(sessao, rid)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+
+store = ResultStore(
+    int(LIMITE_MB_SESSAO * 1024 * 1024),
+    MAX_RESULTADOS_SESSAO,
+    int(LIMITE_MB_TOTAL * 1024 * 1024),
+)
+
+
+def renderizar(df: pd.DataFrame, descricao: str, n: int = 50) -> str:
+    """
+    Salva o resultado completo e devolve o cabeçalho com o id + as primeiras n linhas.
+    Se o resultado for grande demais para guardar, o cabeçalho avisa que não há id.
+    """
+    rid = store.salvar(df, descricao)
+    if rid is None:
+        cabecalho = (
+            f"[resultado grande demais para guardar ({len(df)} linhas, acima do limite de memória "
+            f"de resultados): sem resultado_id, refaça a consulta com filtros"
+        )
+    else:
+        cabecalho = f"[resultado_id={rid} | {len(df)} linhas"
+    cabecalho += f", mostrando {n}]" if len(df) > n else "]"
+    return cabecalho + "\n" + df.head(n).to_string(index=False)
+
+
+# =========================
+# Operações sobre resultados
+# =========================
+def _coluna(df: pd.DataFrame, coluna: str) -> pd.Series:
+    if coluna not in df.columns:
+        raise KeyError(f"Coluna '{coluna}' não existe. Colunas: {list(df.columns)}")
+    return df[coluna]
+
+
+def _converter(serie: pd.Series, valor):
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return pd.to_datetime(valor)
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        return float(valor)
+    return str(valor)
+
+
+def filtrar(df: pd.DataFrame, coluna: str, operador: str, valor) -> pd.DataFrame:
+    serie = _coluna(df, coluna)
+    if operador not in OPERADORES:
+        raise ValueError(f"Operador inválido: {operador}. Use: {OPERADORES}")
+
+    if operador == "contem":
+        mask = serie.astype(str).str.contains(str(valor), case=False, regex=False)
+    elif operador == "em":
+        valores = valor if isinstance(valor, (list, tuple)) else str(valor).split(",")
+        valores = [_converter(serie, v.strip() if isinstance(v, str) else v) for v in valores]
+        mask = (serie.astype(str) if isinstance(valores[0], str) else serie).isin(valores)
+    else:
+        v = _converter(serie, valor)
+        alvo = serie.astype(str) if isinstance(v, str) else serie
+        mask = {
+            "==": alvo == v, "!=": alvo != v, ">": alvo > v,
+            ">=": alvo >= v, "<": alvo < v, "<=": alvo <= v,
+        }[operador]
+    return df[np.asarray(mask, dtype=bool)]
+
+
+def ordenar(df: pd.DataFrame, coluna: str, ascendente: bool = False) -> pd.DataFrame:
+    _coluna(df, coluna)
+    return df.sort_values(coluna, ascending=ascendente)
+
+
+def agregar(df: pd.DataFrame, agrupar_por: list, coluna: str, funcao: str = "sum") -> pd.DataFrame:
+    if funcao not in ("sum", "mean", "min", "max", "count", "median", "nunique"):
+        raise ValueError("funcao deve ser sum, mean, min, max, count, median ou nunique.")
+    for c in list(agrupar_por) + [coluna]:
+        _coluna(df, c)
+    if not agrupar_por:
+        return pd.DataFrame({f"{coluna}_{funcao}": [df[coluna].agg(funcao)]})
+    return (
+        df.groupby(list(agrupar_por), observed=True)[coluna]
+        .agg(funcao)
+        .rename(f"{coluna}_{funcao}")
+        .sort_values(ascending=False)
+        .reset_index()
+    )
+
+
+def paginar(df: pd.DataFrame, pagina: int = 1, tamanho: int = 50) -> pd.DataFrame:
+    inicio = max(pagina - 1, 0) * tamanho
+    return df.iloc[inicio:inicio + tamanho]
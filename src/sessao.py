@@ -0,0 +1,38 @@
+import contextvars
+
+# =========================
+# Sessão atual
+# =========================
+# Cada conversa (chat interativo, pergunta do batch, usuário da API) roda com um id de
+# sessão próprio. O contextvar é herdado pelas tasks/threads que executam as tools.
+
+SESSAO_ATUAL = contextvars.ContextVar("sessao_atual", default="default")
+
+
+def sessao_atual() -> str:
+    return SESSAO_ATUAL.get()
+
+
+def definir_sessao(sessao_id: str):
+    """Define a sessão do contexto atual. Retorna o token para restaurar depois."""
+    return SESSAO_ATUAL.set(str(sessao_id))
+
+
+# =========================
+# Dataset por sessão
+# =========================
+# Cada sessão pode trabalhar sobre um dataset nomeado do registro (ver datasets.py).
+# Sessões sem escolha usam o dataset padrão.
+_DATASET_POR_SESSAO: dict = {}
+
+
+def dataset_atual() -> str | None:
+    return _DATASET_POR_SESSAO.get(sessao_atual())
+
+
+def selecionar_dataset(nome: str | None):
+    """Fixa o dataset da sessão atual (None volta para o padrão)."""
+    if nome is None:
+        _DATASET_POR_SESSAO.pop(sessao_atual(), None)
+    else:
+        _DATASET_POR_SESSAO[sessao_atual()] = str(nome)
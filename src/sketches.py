@@ -0,0 +1,253 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# =========================
+# Modo aproximado: sketches mantidos na carga
+# =========================
+# - HyperLogLog: contagem de distintos (product_id, local) com erro relativo ~1.04/sqrt(m).
+# - DDSketch: quantis de preço e nível de serviço com erro relativo garantido (alpha).
+# - Reservoir sample: amostra uniforme de linhas (médias/MAPE com intervalo de 95%).
+# - Somas exatas (aditivas) de volume, planejado e gap.
+# Todos são "mergeáveis": a carga processa o dataset em blocos, como faria um ingest
+# incremental, e as respostas custam O(tamanho do sketch), não O(linhas).
+
+_Z95 = 1.96
+
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    """Número de bits significativos de cada uint64 (vetorizado, sem float)."""
+    x = x.copy()
+    n = np.zeros(x.shape, dtype=np.int64)
+    for s in (32, 16, 8, 4, 2, 1):
+        m = x >= (np.uint64(1) << np.uint64(s))
+        n[m] += s
+        x[m] >>= np.uint64(s)
+    return n + (x > 0)
+
+
+class HyperLogLog:
+    def __init__(self, p: int = 14):
+        self.p = p
+        self.m = 1 << p
+        self.registros = np.zeros(self.m, dtype=np.uint8)
+
+    def adicionar(self, valores: pd.Series):
+        h = pd.util.hash_pandas_object(valores.dropna().astype(str), index=False).to_numpy(dtype=np.uint64)
+        if len(h) == 0:
+            return
+        bits = 64 - self.p
+        idx = (h >> np.uint64(bits)).astype(np.int64)
+        resto = h & np.uint64((1 << bits) - 1)
+        rank = (bits - _bit_length(resto) + 1).astype(np.uint8)
+        np.maximum.at(self.registros, idx, rank)
+
+    def merge(self, outro: "HyperLogLog"):
+        np.maximum(self.registros, outro.registros, out=self.registros)
+
+    def estimar(self) -> float:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimativa = alpha * m * m / np.sum(np.power(2.0, -self.registros.astype(float)))
+        zeros = int(np.sum(self.registros == 0))
+        if estimativa <= 2.5 * m and zeros:
+            estimativa = m * math.log(m / zeros)  # correção para cardinalidades pequenas
+        return float(estimativa)
+
+    @property
+    def erro_relativo_95(self) -> float:
+        return _Z95 * 1.04 / math.sqrt(self.m)
+
+
+class DDSketch:
+    """Quantis com erro relativo <= alpha (valores >= 0; negativos são descartados)."""
+
+    def __init__(self, alpha: float = 0.01):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: dict = {}
+        self.zeros = 0
+        self.n = 0
+
+    def adicionar(self, valores: pd.Series):
+        v = pd.to_numeric(valores, errors="coerce").to_numpy(dtype=float)
+        v = v[np.isfinite(v) & (v >= 0)]
+        self.n += len(v)
+        self.zeros += int(np.sum(v == 0))
+        pos = v[v > 0]
+        if len(pos) == 0:
+            return
+        chaves, contagens = np.unique(np.ceil(np.log(pos) / self._log_gamma).astype(np.int64), return_counts=True)
+        for k, c in zip(chaves.tolist(), contagens.tolist()):
+            self.bins[k] = self.bins.get(k, 0) + c
+
+    def merge(self, outro: "DDSketch"):
+        self.n += outro.n
+        self.zeros += outro.zeros
+        for k, c in outro.bins.items():
+            self.bins[k] = self.bins.get(k, 0) + c
+
+    def quantil(self, q: float) -> float:
+        if self.n == 0:
+            return float("nan")
+        alvo = q * (self.n - 1)
+        acumulado = self.zeros
+        if alvo < acumulado:
+            return 0.0
+        for k in sorted(self.bins):
+            acumulado += self.bins[k]
+            if acumulado > alvo:
+                return 2 * self.gamma ** k / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+
+class Reservoir:
+    """Amostra uniforme de tamanho fixo (algoritmo R vetorizado por bloco)."""
+
+    def __init__(self, k: int = 20_000, seed: int = 42):
+        self.k = k
+        self.visto = 0
+        self.amostra: pd.DataFrame | None = None
+        self._rng = np.random.default_rng(seed)
+
+    def adicionar(self, bloco: pd.DataFrame):
+        n = len(bloco)
+        if n == 0:
+            return
+        if self.amostra is None:
+            self.amostra = bloco.iloc[: self.k].reset_index(drop=True)
+            usados = len(self.amostra)
+        else:
+            falta = self.k - len(self.amostra)
+            usados = max(min(falta, n), 0)
+            if usados:
+                self.amostra = pd.concat([self.amostra, bloco.iloc[:usados]], ignore_index=True)
+
+        # linhas restantes: a i-ésima linha global entra com prob k/(i+1), em um slot aleatório
+        # (slot sorteado mais de uma vez fica com a última linha, igual ao algoritmo sequencial)
+        restantes = np.arange(usados, n)
+        if len(restantes):
+            posicoes_globais = self.visto + restantes
+            slots = (self._rng.random(len(restantes)) * (posicoes_globais + 1)).astype(np.int64)
+            aceitas = np.flatnonzero(slots < self.k)
+            if len(aceitas):
+                destino_rev, primeira = np.unique(slots[aceitas][::-1], return_index=True)
+                origem = restantes[aceitas][::-1][primeira]
+                for j, coluna in enumerate(self.amostra.columns):
+                    self.amostra.iloc[destino_rev, j] = bloco[coluna].to_numpy()[origem]
+        self.visto += n
+
+
+def construir_sketches(df: pd.DataFrame, tamanho_bloco: int = 500_000, tamanho_amostra: int = 20_000) -> dict:
+    """Processa o dataset em blocos e devolve os sketches + somas exatas."""
+    sk = {
+        "linhas": 0,
+        "produtos": HyperLogLog(),
+        "locais": HyperLogLog(),
+        "preco": DDSketch(),
+        "service_level": DDSketch(),
+        "amostra": Reservoir(k=tamanho_amostra),
+        "soma_real": 0.0,
+        "soma_planejado": 0.0,
+    }
+    for inicio in range(0, len(df), tamanho_bloco):
+        bloco = df.iloc[inicio:inicio + tamanho_bloco]
+        sk["linhas"] += len(bloco)
+        sk["produtos"].adicionar(bloco["product_id"])
+        sk["locais"].adicionar(bloco["local"])
+        sk["preco"].adicionar(bloco["actual_price"])
+        sk["service_level"].adicionar(bloco["service_level"])
+        sk["amostra"].adicionar(bloco)
+        sk["soma_real"] += float(pd.to_numeric(bloco["actual_quantity"], errors="coerce").sum())
+        sk["soma_planejado"] += float(pd.to_numeric(bloco["planned_quantity"], errors="coerce").sum())
+    return sk
+
+
+# =========================
+# Respostas aproximadas (tempo constante)
+# =========================
+def _media_ic(valores) -> dict:
+    v = pd.to_numeric(pd.Series(valores), errors="coerce").dropna().to_numpy(dtype=float)
+    if len(v) == 0:
+        return {"estimativa": None, "ic95": None, "n_amostra": 0}
+    media = float(v.mean())
+    margem = float(_Z95 * v.std(ddof=1) / math.sqrt(len(v))) if len(v) > 1 else float("nan")
+    return {"estimativa": media, "ic95": [media - margem, media + margem], "n_amostra": int(len(v))}
+
+
+def _quantis(sketch: DDSketch) -> dict:
+    return {
+        "p50": sketch.quantil(0.50),
+        "p90": sketch.quantil(0.90),
+        "p99": sketch.quantil(0.99),
+        "erro_relativo_max": sketch.alpha,
+    }
+
+
+def resumo_aproximado(sk: dict) -> dict:
+    """Distintos, quantis e totais a partir dos sketches."""
+    return {
+        "modo": "aproximado",
+        "linhas": sk["linhas"],
+        "produtos_distintos": {
+            "estimativa": round(sk["produtos"].estimar()),
+            "erro_relativo_95%": round(sk["produtos"].erro_relativo_95 * 100, 2),
+        },
+        "locais_distintos": {
+            "estimativa": round(sk["locais"].estimar()),
+            "erro_relativo_95%": round(sk["locais"].erro_relativo_95 * 100, 2),
+        },
+        "quantis_preco": _quantis(sk["preco"]),
+        "quantis_service_level": _quantis(sk["service_level"]),
+        "total_vendido_exato": sk["soma_real"],
+        "total_planejado_exato": sk["soma_planejado"],
+    }
+
+
+def gap_aproximado(sk: dict) -> dict:
+    """Mesmo formato de analytics.analyze_planning_gap; MAPE vem da amostra (com IC 95%)."""
+    amostra = sk["amostra"].amostra
+    gap_total = sk["soma_real"] - sk["soma_planejado"]
+    mape = {"estimativa": None, "ic95": None, "n_amostra": 0}
+    if amostra is not None:
+        plan = pd.to_numeric(amostra["planned_quantity"], errors="coerce")
+        real = pd.to_numeric(amostra["actual_quantity"], errors="coerce")
+        validos = plan > 0
+        mape = _media_ic((real[validos] - plan[validos]).abs() / plan[validos] * 100)
+
+    return {
+        "modo": "aproximado",
+        "gap_total": gap_total,
+        "mape_medio": f"{mape['estimativa']:.2f}%" if mape["estimativa"] is not None else "N/A",
+        "mape_ic95": [f"{x:.2f}%" for x in mape["ic95"]] if mape["ic95"] else None,
+        "tendencia": "Subestimado" if gap_total > 0 else "Superestimado",
+        "linhas_amostra_mape": mape["n_amostra"],
+    }
+
+
+def promocao_aproximada(sk: dict) -> dict:
+    """Médias com/sem promoção (volume, preço, serviço) estimadas pela amostra, com IC 95%."""
+    amostra = sk["amostra"].amostra
+    if amostra is None:
+        return {"modo": "aproximado", "erro": "Amostra vazia."}
+
+    com = amostra["promotion_type"].notna()
+    out = {"modo": "aproximado", "linhas_amostra": int(len(amostra))}
+    for nome, mask in (("Com Promo", com), ("Sem Promo", ~com)):
+        parte = amostra[mask]
+        out[nome] = {
+            "media_volume": _media_ic(parte["actual_quantity"]),
+            "preco_medio": _media_ic(parte["actual_price"]),
+            "nivel_servico_medio": _media_ic(parte["service_level"]),
+        }
+    return out
+
+
+def amostra_linhas(sk: dict, n: int = 20, seed: int | None = None) -> pd.DataFrame:
+    """Linhas sorteadas uniformemente da reservoir sample."""
+    amostra = sk["amostra"].amostra
+    if amostra is None:
+        return pd.DataFrame()
+    return amostra.sample(n=min(n, len(amostra)), random_state=seed)
@@ -0,0 +1,155 @@
+import importlib.util
+import os
+import re
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+import analytics as t
+import datasets
+
+# =========================
+# Engine SQL embarcada (DuckDB) para a consulta genérica
+# =========================
+# Se SALES_PARQUET apontar para um arquivo Parquet, a view `sales` do dataset padrão lê
+# direto dele (vetorizado, multi-thread, com pushdown de filtros em date/local via
+# estatísticas dos row groups). O Parquet é um retrato do CSV: só vale para a versão
+# carregada na partida, e só se não for mais antigo que o CSV. Depois de uma recarga
+# (ou para outros datasets do registro), a view é registrada sobre o DataFrame em
+# memória da versão ativa (sem cópia).
+# A conexão é um sandbox: sem acesso a arquivos/rede (read_csv, read_text, COPY, ATTACH
+# falham), exceto leitura do próprio Parquet, e a configuração fica travada para que o
+# SQL gerado pelo LLM não consiga reabri-la.
+
+PARQUET_PATH = os.getenv("SALES_PARQUET")  # só usado se configurado explicitamente
+PARQUET_PADRAO = "data/sales.parquet"  # destino de exportar_parquet sem SALES_PARQUET
+LIMITE_LINHAS = 200
+
+_duckdb = None
+_con = None
+_versao_registrada = None
+_NAO_VERIFICADO = object()
+_parquet_permitido = _NAO_VERIFICADO
+_lock = threading.Lock()
+
+_SQL_PERMITIDO = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+
+
+def disponivel() -> bool:
+    """True se o duckdb (opcional) estiver instalado. Não importa o módulo."""
+    return importlib.util.find_spec("duckdb") is not None
+
+
+def _get_duckdb():
+    """Importa o duckdb só no primeiro uso."""
+    global _duckdb
+    if _duckdb is None:
+        if not disponivel():
+            raise RuntimeError("duckdb não está instalado (pip install duckdb).")
+        import duckdb
+
+        _duckdb = duckdb
+    return _duckdb
+
+
+def _parquet_atualizado() -> str | None:
+    """Caminho absoluto do Parquet configurado, se existir e não for mais antigo que o CSV."""
+    if not PARQUET_PATH:
+        return None
+    parquet = Path(PARQUET_PATH).resolve()
+    if not parquet.exists():
+        return None
+    csv = Path(datasets.caminho(t.DATASET_PADRAO))
+    if csv.exists() and parquet.stat().st_mtime < csv.stat().st_mtime:
+        print(f"[consulta_sql: {PARQUET_PATH} é mais antigo que o CSV; usando o dataset em memória]")
+        return None
+    return str(parquet)
+
+
+def _parquet_da_conexao() -> str | None:
+    """Parquet liberado para a conexão (verificado uma vez; a configuração fica travada)."""
+    global _parquet_permitido
+    if _parquet_permitido is _NAO_VERIFICADO:
+        _parquet_permitido = _parquet_atualizado()
+    return _parquet_permitido
+
+
+def usa_parquet(versao: tuple) -> bool:
+    """True se a consulta nessa versão lê o Parquet (e não o DataFrame em memória)."""
+    return versao == (t.DATASET_PADRAO, 1) and _parquet_da_conexao() is not None
+
+
+def _conectar_sandbox():
+    """Conexão em memória sem acesso externo; só o Parquet (se válido) pode ser lido."""
+    parquet = _parquet_da_conexao()
+    config = {
+        "enable_external_access": False,
+        "autoinstall_known_extensions": False,
+        "autoload_known_extensions": False,
+        "lock_configuration": True,
+    }
+    if parquet:
+        config["allowed_paths"] = [parquet]
+    return _get_duckdb().connect(database=":memory:", config=config)
+
+
+def _conexao():
+    global _con, _versao_registrada
+    if _con is None:
+        _con = _conectar_sandbox()
+
+    # acompanha o dataset da sessão e a versão ativa (recarga a quente); o Parquet só
+    # vale para a primeira versão do dataset padrão (a que corresponde ao arquivo)
+    dados, versao = t.snapshot()
+    usar_parquet = usa_parquet(versao)
+    alvo = ("parquet", versao) if usar_parquet else versao
+    if alvo != _versao_registrada:
+        if usar_parquet:
+            caminho = _parquet_da_conexao().replace("'", "''")
+            _con.execute(f"CREATE OR REPLACE VIEW sales AS SELECT * FROM read_parquet('{caminho}')")
+        else:
+            _con.register("sales_df", dados)
+            _con.execute("CREATE OR REPLACE VIEW sales AS SELECT * FROM sales_df")
+        _versao_registrada = alvo
+    return _con
+
+
+def executar_sql(sql: str, limite: int = LIMITE_LINHAS) -> pd.DataFrame:
+    """
+    Executa um SELECT somente-leitura sobre a tabela `sales`.
+    O resultado é limitado a `limite` linhas (o limite é aplicado dentro do DuckDB).
+    """
+    sql = sql.strip().rstrip(";")
+    if not _SQL_PERMITIDO.match(sql) or ";" in sql:
+        raise ValueError("Apenas uma única consulta SELECT/WITH é permitida.")
+
+    with _lock:
+        con = _conexao()
+        return con.execute(f"SELECT * FROM ({sql}) AS q LIMIT {int(limite)}").fetchdf()
+
+
+def exportar_parquet(output_path: str = PARQUET_PATH or PARQUET_PADRAO, row_group_size: int = 100_000) -> str:
+    """
+    Converte o dataset em memória para Parquet ordenado por local e date, para que
+    as estatísticas min/max dos row groups permitam pular blocos em filtros por
+    período/local. Retorna o caminho gerado.
+    """
+    out = Path(output_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    caminho = str(out).replace("'", "''")
+
+    con = _get_duckdb().connect(database=":memory:")
+    try:
+        con.register("origem", t.snapshot()[0])
+        con.execute(
+            f"COPY (SELECT * FROM origem ORDER BY local, date) TO '{caminho}' "
+            f"(FORMAT PARQUET, ROW_GROUP_SIZE {int(row_group_size)})"
+        )
+    finally:
+        con.close()
+    return str(out)
+
+
+if __name__ == "__main__":
+    print(exportar_parquet())
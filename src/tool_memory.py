@@ -0,0 +1,198 @@
+import contextvars
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from sessao import sessao_atual
+
+# =========================
+# Memória por chamada de tool: perfil e orçamento
+# =========================
+# - TOOL_MEM_PROFILE=1: cada chamada roda sob tracemalloc e registra pico, blocos e bytes
+#   que ficaram alocados, a maior alocação retida (arquivo:linha) e o maior DataFrame
+#   intermediário entregue à tool. O tracemalloc é global do processo, então com o
+#   perfil ligado as chamadas de tools são serializadas (medição limpa, custo de vazão).
+# - TOOL_MEM_BUDGET_MB=<n>: antes de montar o recorte de dados, o pico é estimado
+#   (linhas x bytes por linha x TOOL_MEM_FATOR). Se passar do orçamento, a chamada é
+#   rejeitada. Só tools "amostráveis" (listagens de linhas e médias, cujo resultado
+#   continua válido numa amostra) rodam sobre uma amostra uniforme que cabe, com aviso
+#   na saída (TOOL_MEM_POLITICA=rejeitar desliga a amostragem). Tools de soma/contagem
+#   e derivados em cache (calculados sobre o dataset inteiro) nunca são amostrados.
+
+PERFIL_HABILITADO = os.getenv("TOOL_MEM_PROFILE", "0") == "1"
+ORCAMENTO_BYTES = float(os.getenv("TOOL_MEM_BUDGET_MB", "0")) * 1024 * 1024
+POLITICA = os.getenv("TOOL_MEM_POLITICA", "amostrar")
+FATOR_PICO = float(os.getenv("TOOL_MEM_FATOR", "3"))
+
+_CHAMADA = contextvars.ContextVar("chamada_tool_memoria", default=None)
+REGISTROS_TURNO = contextvars.ContextVar("registros_memoria_turno", default=None)
+
+historico = deque(maxlen=int(os.getenv("TOOL_MEM_HISTORICO", "500")))
+_LOCK_PERFIL = threading.Lock()
+_rng = np.random.default_rng()
+
+
+class OrcamentoMemoriaExcedido(Exception):
+    pass
+
+
+def iniciar_registro() -> list:
+    """Lista que recebe os registros de memória das tools chamadas no contexto atual."""
+    registros = []
+    REGISTROS_TURNO.set(registros)
+    return registros
+
+
+# =========================
+# Estimativa e orçamento (chamados ao montar o recorte de dados)
+# =========================
+def bytes_por_linha(df: pd.DataFrame, amostra: int = 2000) -> float:
+    """Bytes por linha medidos (deep, incluindo strings) em uma amostra do dataset."""
+    if len(df) == 0:
+        return 0.0
+    parte = df.iloc[: min(amostra, len(df))]
+    return float(parte.memory_usage(index=False, deep=True).sum()) / len(parte)
+
+
+def limitar_linhas(n_linhas: int, bytes_linha: float, amostravel: bool | None = None) -> float | None:
+    """
+    Fração das linhas que cabe no orçamento (None = todas). Levanta
+    OrcamentoMemoriaExcedido se não couber e a chamada não puder ser amostrada
+    (amostravel=None usa o que a tool declarou). Fora de uma chamada de tool não limita.
+    """
+    chamada = _CHAMADA.get()
+    if chamada is None:
+        return None
+    previsto = n_linhas * bytes_linha * FATOR_PICO
+    chamada["previsto_bytes"] = max(chamada["previsto_bytes"], int(previsto))
+
+    if not ORCAMENTO_BYTES or previsto <= ORCAMENTO_BYTES:
+        return None
+    pode_amostrar = chamada["amostravel"] if amostravel is None else amostravel
+    if POLITICA == "rejeitar" or not pode_amostrar:
+        raise OrcamentoMemoriaExcedido(
+            f"pico estimado de {previsto / 2**20:.0f} MB passa do orçamento de "
+            f"{ORCAMENTO_BYTES / 2**20:.0f} MB. Use filtros (período, locais, produtos) para reduzir o recorte."
+        )
+
+    fracao = ORCAMENTO_BYTES / previsto
+    chamada["degradado"] = (
+        f"calculado sobre uma amostra de {fracao:.1%} das linhas (orçamento de memória): "
+        "médias são estimativas e listagens trazem só as linhas da amostra"
+    )
+    return fracao
+
+
+def amostrar(linhas: np.ndarray, fracao: float) -> np.ndarray:
+    """Amostra uniforme (sem reposição, em ordem) de posições de linhas."""
+    n = max(int(len(linhas) * fracao), 1)
+    return np.sort(_rng.choice(linhas, size=min(n, len(linhas)), replace=False))
+
+
+def registrar_intermediario(df: pd.DataFrame):
+    """Anota o tamanho de um DataFrame entregue à tool (maior intermediário da chamada)."""
+    chamada = _CHAMADA.get()
+    if chamada is None or not PERFIL_HABILITADO:
+        return
+    tamanho = int(df.memory_usage(index=True, deep=False).sum())
+    chamada["maior_intermediario_bytes"] = max(chamada["maior_intermediario_bytes"], tamanho)
+
+
+# =========================
+# Execução medida
+# =========================
+def _com_tracemalloc(fn, args, kwargs) -> tuple:
+    with _LOCK_PERFIL:
+        tracemalloc.start()
+        try:
+            resultado = fn(*args, **kwargs)
+            _, pico = tracemalloc.get_traced_memory()
+            stats = tracemalloc.take_snapshot().statistics("lineno")
+        finally:
+            tracemalloc.stop()
+
+    maior = stats[0] if stats else None
+    return resultado, {
+        "pico_bytes": int(pico),
+        "bytes_retidos": int(sum(s.size for s in stats)),
+        "blocos_retidos": int(sum(s.count for s in stats)),
+        "maior_alocacao": f"{maior.traceback[0].filename}:{maior.traceback[0].lineno} ({maior.size} B)" if maior else None,
+    }
+
+
+def _anotar(resultado, aviso: str | None):
+    if not aviso:
+        return resultado
+    if isinstance(resultado, str):
+        return f"[Aviso: {aviso}]\n{resultado}"
+    if isinstance(resultado, dict):
+        return {**resultado, "aviso_memoria": aviso}
+    return resultado
+
+
+def medir(nome: str, fn, args: tuple = (), kwargs: dict | None = None, amostravel: bool = False):
+    """
+    Executa a tool `fn` aplicando o orçamento e, se habilitado, o perfil de memória.
+    amostravel=True: acima do orçamento a tool pode rodar sobre uma amostra de linhas.
+    """
+    kwargs = kwargs or {}
+    chamada = {"previsto_bytes": 0, "maior_intermediario_bytes": 0, "degradado": None, "amostravel": amostravel}
+    token = _CHAMADA.set(chamada)
+    inicio = time.perf_counter()
+    perfil = {}
+    rejeitada = None
+    try:
+        if PERFIL_HABILITADO:
+            resultado, perfil = _com_tracemalloc(fn, args, kwargs)
+        else:
+            resultado = fn(*args, **kwargs)
+    except OrcamentoMemoriaExcedido as e:
+        rejeitada = str(e)
+        resultado = f"Erro: chamada rejeitada, {e}"
+    finally:
+        _CHAMADA.reset(token)
+
+    if PERFIL_HABILITADO or chamada["degradado"] or rejeitada:
+        registro = {
+            "ferramenta": nome,
+            "sessao": sessao_atual(),
+            "segundos": round(time.perf_counter() - inicio, 4),
+            **perfil,
+            "maior_intermediario_bytes": chamada["maior_intermediario_bytes"],
+            "previsto_bytes": chamada["previsto_bytes"],
+            "degradado": chamada["degradado"],
+            "rejeitada": rejeitada,
+        }
+        historico.append(registro)
+        turno = REGISTROS_TURNO.get()
+        if turno is not None:
+            turno.append(registro)
+
+    return _anotar(resultado, chamada["degradado"])
+
+
+def resumo_por_ferramenta() -> pd.DataFrame:
+    """Picos (máximo e médio) por tool nas chamadas registradas, do maior para o menor."""
+    if not historico:
+        return pd.DataFrame()
+    dados = pd.DataFrame(list(historico))
+    if "pico_bytes" not in dados.columns:
+        dados["pico_bytes"] = np.nan
+    return (
+        dados.groupby("ferramenta")
+        .agg(
+            chamadas=("ferramenta", "size"),
+            pico_max_mb=("pico_bytes", lambda s: s.max() / 2**20),
+            pico_medio_mb=("pico_bytes", lambda s: s.mean() / 2**20),
+            maior_intermediario_mb=("maior_intermediario_bytes", lambda s: s.max() / 2**20),
+            degradadas=("degradado", "count"),
+            rejeitadas=("rejeitada", "count"),
+        )
+        .sort_values("pico_max_mb", ascending=False)
+        .reset_index()
+    )
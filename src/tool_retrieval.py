@@ -0,0 +1,107 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+
+try:
+    from llama_index.core.objects import ObjectRetriever
+except Exception:  # versões sem suporte a tool_retriever
+    ObjectRetriever = None
+
+# =========================
+# Seleção dinâmica de ferramentas
+# =========================
+# Em vez de mandar as descrições/schemas de TODAS as tools em cada passo do ReAct,
+# indexamos as descrições localmente (BM25) e expomos só as top-k mais relevantes
+# para a pergunta, além das ferramentas fixas (ex: consulta_geral).
+
+_STOPWORDS = {
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "no", "na", "nos", "nas",
+    "por", "para", "com", "um", "uma", "que", "qual", "quais", "se", "ou", "ao", "aos", "the",
+    "of", "and", "to", "is", "str", "int", "float", "bool", "dict", "none", "list",
+}
+
+# ferramentas genéricas que sempre ficam disponíveis ao agente
+FIXAS = (
+    "consulta_geral", "consulta_metricas", "consulta_sql",
+    "resultados_listar", "resultado_filtrar", "resultado_ordenar", "resultado_agregar", "resultado_pagina",
+    "exportar_resultado",
+)
+
+
+def _tokens(texto: str) -> list:
+    """Tokeniza sem acentos, quebra snake_case e reduz cada termo a um prefixo (stem simples)."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    termos = re.split(r"[^a-z0-9]+", texto)
+    return [t[:6] for t in termos if len(t) > 1 and t not in _STOPWORDS]
+
+
+class IndiceFerramentas:
+    """Índice BM25 sobre nome + descrição de cada ferramenta."""
+
+    def __init__(self, tools, fixas=FIXAS, k1: float = 1.5, b: float = 0.75):
+        self.tools = list(tools)
+        self.fixas = [tool for tool in self.tools if tool.metadata.name in fixas]
+        self._candidatas = [tool for tool in self.tools if tool.metadata.name not in fixas]
+        self.k1 = k1
+        self.b = b
+
+        self._docs = []
+        for tool in self._candidatas:
+            nome = tool.metadata.name
+            # nome pesa mais que a descrição
+            self._docs.append(Counter(_tokens(nome) * 3 + _tokens(tool.metadata.description)))
+
+        n = len(self._docs)
+        self._tamanho_medio = (sum(sum(d.values()) for d in self._docs) / n) if n else 0.0
+        df_termos = Counter(termo for d in self._docs for termo in d)
+        self._idf = {
+            termo: math.log(1 + (n - freq + 0.5) / (freq + 0.5)) for termo, freq in df_termos.items()
+        }
+
+    def pontuar(self, pergunta: str) -> list:
+        """Retorna [(score, tool)] em ordem decrescente de relevância."""
+        consulta = set(_tokens(pergunta))
+        resultado = []
+        for doc, tool in zip(self._docs, self._candidatas):
+            tamanho = sum(doc.values())
+            score = 0.0
+            for termo in consulta:
+                tf = doc.get(termo)
+                if not tf:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * tamanho / (self._tamanho_medio or 1))
+                score += self._idf[termo] * tf * (self.k1 + 1) / (tf + norm)
+            resultado.append((score, tool))
+        resultado.sort(key=lambda par: par[0], reverse=True)
+        return resultado
+
+    def buscar(self, pergunta: str, top_k: int = 8) -> list:
+        """Top-k ferramentas relevantes (sem as fixas, que sempre vão ao agente)."""
+        return [tool for score, tool in self.pontuar(pergunta)[:top_k] if score > 0]
+
+
+if ObjectRetriever is not None:
+
+    class RetrieverFerramentas(ObjectRetriever):
+        """Adapta o IndiceFerramentas à interface de tool_retriever do LlamaIndex."""
+
+        def __init__(self, indice: IndiceFerramentas, top_k: int = 8):
+            self._indice = indice
+            self._top_k = top_k
+
+        def retrieve(self, str_or_query_bundle):
+            pergunta = getattr(str_or_query_bundle, "query_str", str_or_query_bundle)
+            return self._indice.buscar(str(pergunta or ""), self._top_k)
+
+        async def aretrieve(self, str_or_query_bundle):
+            return self.retrieve(str_or_query_bundle)
+
+else:
+    RetrieverFerramentas = None
+
+
+def suportado() -> bool:
+    """True se a versão do LlamaIndex aceita tool_retriever."""
+    return RetrieverFerramentas is not None
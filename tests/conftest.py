@@ -0,0 +1,43 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+# =========================
+# Ambiente dos testes
+# =========================
+# analytics lê o CSV já na importação: antes de qualquer import dos módulos de src/,
+# aponta SALES_CSV para um CSV pequeno (mesmo formato do real: sep=";", datas dd/mm/aaaa),
+# sem cache colunar em disco e com exportações numa pasta temporária.
+
+_TMP = Path(tempfile.mkdtemp(prefix="agente_testes_"))
+
+VENDAS = pd.DataFrame({
+    "date": pd.to_datetime(["2023-12-30", "2023-12-31", "2024-01-01", "2024-01-02", "2024-01-02"]),
+    "product_id": ["A", "A", "B", "B", "C"],
+    "local": ["L1", "L2", "L1", "L2", "L1"],
+    "actual_quantity": [10.0, 20.0, 5.0, 0.0, 7.0],
+    "planned_quantity": [8.0, 20.0, 10.0, 0.0, 7.0],
+    "actual_price": [2.0, 2.0, 3.0, 3.0, 1.0],
+    "promotion_type": ["X", None, None, "Y", None],
+    "service_level": [0.9, 0.8, 1.0, 0.7, 0.95],
+})
+
+_CSV = _TMP / "sales.csv"
+VENDAS.assign(date=VENDAS["date"].dt.strftime("%d/%m/%Y")).to_csv(_CSV, sep=";", index=False)
+
+os.environ["SALES_CSV"] = str(_CSV)
+os.environ["DATASETS_MMAP"] = "0"
+os.environ["EXPORT_DIR"] = str(_TMP / "exports")
+os.environ.pop("SALES_DATASETS", None)
+os.environ.pop("TOOL_MEM_BUDGET_MB", None)
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+
+@pytest.fixture
+def vendas() -> pd.DataFrame:
+    return VENDAS.copy()
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+import analytics as t
+
+
+def _serie(datas, residuos) -> pd.DataFrame:
+    """Uma série (P, L) com planejado 10 e realizado = planejado + resíduo."""
+    return pd.DataFrame({
+        "date": pd.to_datetime(datas),
+        "product_id": "P",
+        "local": "L",
+        "actual_quantity": 10.0 + np.asarray(residuos, dtype=float),
+        "planned_quantity": 10.0,
+        "actual_price": 1.0,
+        "promotion_type": None,
+        "service_level": 1.0,
+    })
+
+
+def _janeiro(pico_em: int | None = None) -> tuple:
+    datas = list(pd.date_range("2024-01-01", "2024-01-31"))
+    residuos = [(-1) ** i for i in range(len(datas))]
+    if pico_em is not None:
+        residuos[pico_em] = 20
+    return datas, residuos
+
+
+def test_janela_conta_dias_de_calendario():
+    # 2024-06-01 não tem nenhum dia registrado nos 28 dias anteriores: sem base, sem alerta
+    datas, residuos = _janeiro(pico_em=30)
+    out = t.detectar_anomalias_series(_serie(datas + [pd.Timestamp("2024-06-01")], residuos + [20]))
+
+    assert len(out) == 1
+    episodio = out.iloc[0]
+    assert episodio["tipo"] == "ruptura"
+    assert episodio["inicio"] == episodio["fim"] == pd.Timestamp("2024-01-31")
+    assert episodio["dias"] == 1
+
+
+def test_dia_sem_registro_quebra_o_episodio():
+    datas, residuos = _janeiro(pico_em=29)
+    datas, residuos = datas[:30], residuos[:30]  # sem 2024-01-31
+    out = t.detectar_anomalias_series(_serie(datas + [pd.Timestamp("2024-02-01")], residuos + [20]))
+
+    assert sorted(out["inicio"]) == [pd.Timestamp("2024-01-30"), pd.Timestamp("2024-02-01")]
+    assert (out["dias"] == 1).all()
+    assert ((out["fim"] - out["inicio"]).dt.days + 1 == out["dias"]).all()
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import export
+
+
+@pytest.fixture(autouse=True)
+def pasta_exportacao(tmp_path, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _frame(linhas: int = 10) -> pd.DataFrame:
+    return pd.DataFrame({"id": range(linhas), "valor": np.arange(linhas) * 1.5})
+
+
+def test_csv_em_blocos_preserva_linhas():
+    df = _frame(10)
+    info = export.exportar_blocos(export.blocos(df, tamanho=3), "teste")
+
+    assert info["linhas"] == 10
+    lido = pd.read_csv(info["caminho"], sep=";")
+    pd.testing.assert_frame_equal(lido, df)
+
+
+def test_posicoes_e_blocos_vazios():
+    df = _frame(10)
+    posicoes = np.array([1, 4, 7])
+    partes = [df.iloc[:0], *export.blocos(df, posicoes=posicoes, tamanho=2), df.iloc[:0]]
+    info = export.exportar_blocos(partes, "teste")
+
+    assert info["linhas"] == 3
+    assert pd.read_csv(info["caminho"], sep=";")["id"].tolist() == [1, 4, 7]
+
+
+def test_csv_gzip():
+    info = export.exportar_blocos(export.blocos(_frame(5), tamanho=2), "teste", compressao="gzip")
+    assert info["caminho"].endswith(".csv.gz")
+    assert len(pd.read_csv(info["caminho"], sep=";", compression="gzip")) == 5
+
+
+def test_nomes_padrao_nao_colidem():
+    a = export.exportar_blocos([_frame(2)], "teste")
+    b = export.exportar_blocos([_frame(2)], "teste")
+    assert a["caminho"] != b["caminho"]
+
+
+def test_nome_arquivo_fica_na_pasta(pasta_exportacao):
+    info = export.exportar_blocos([_frame(2)], "teste", nome_arquivo="saida")
+    assert info["caminho"] == str((pasta_exportacao / "saida.csv").resolve())
+
+
+@pytest.mark.parametrize("nome", ["../fora.csv", "sub/saida.csv", "/tmp/saida.csv", "..", ""])
+def test_nome_arquivo_com_caminho_rejeitado(nome):
+    with pytest.raises(ValueError):
+        export.resolver_destino(nome, "csv", None)
+
+
+def test_arquivo_existente_nao_e_sobrescrito(pasta_exportacao):
+    export.exportar_blocos([_frame(2)], "teste", nome_arquivo="saida.csv")
+    with pytest.raises(FileExistsError):
+        export.exportar_blocos([_frame(5)], "teste", nome_arquivo="saida.csv")
+    assert len(pd.read_csv(pasta_exportacao / "saida.csv", sep=";")) == 2
+
+
+def test_parquet_em_blocos_com_coluna_nula_no_primeiro_bloco():
+    pytest.importorskip("pyarrow")
+    df = _frame(6).assign(promotion_type=[None, None, "X", None, "Y", None])
+    info = export.exportar_blocos(export.blocos(df, tamanho=2), "teste", formato="parquet")
+
+    assert info["linhas"] == 6
+    lido = pd.read_parquet(info["caminho"])
+    assert lido["promotion_type"].tolist() == [None, None, "X", None, "Y", None]
+    assert lido["id"].tolist() == list(range(6))
+
+
+def test_falha_no_meio_nao_deixa_arquivo_parcial(pasta_exportacao):
+    def partes():
+        yield _frame(3)
+        raise RuntimeError("falhou no segundo bloco")
+
+    with pytest.raises(RuntimeError):
+        export.exportar_blocos(partes(), "teste", nome_arquivo="parcial.csv")
+    assert not (pasta_exportacao / "parcial.csv").exists()
+    assert export.exportar_blocos([_frame(2)], "teste", nome_arquivo="parcial.csv")["linhas"] == 2
+
+
+def test_formato_e_compressao_invalidos():
+    with pytest.raises(ValueError):
+        export.exportar_blocos([_frame(2)], "teste", formato="xlsx")
+    with pytest.raises(ValueError):
+        export.exportar_blocos([_frame(2)], "teste", formato="csv", compressao="zstd")
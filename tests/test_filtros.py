@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+import analytics as t
+
+
+@pytest.fixture
+def indice(vendas):
+    return t.construir_indice_filtros(vendas)
+
+
+def test_sem_filtros(indice):
+    assert t.mascara_filtros(indice) is None
+
+
+def test_and_entre_colunas_or_entre_valores(vendas, indice):
+    mask = t.mascara_filtros(indice, locais=["L1"], produtos=["A", "B"])
+    esperado = (vendas["local"] == "L1") & vendas["product_id"].isin(["A", "B"])
+    np.testing.assert_array_equal(mask, esperado.to_numpy())
+
+
+def test_valor_unico_como_string(vendas, indice):
+    mask = t.mascara_filtros(indice, locais="L2")
+    np.testing.assert_array_equal(mask, (vendas["local"] == "L2").to_numpy())
+
+
+def test_sem_promo_casa_nulos(vendas, indice):
+    mask = t.mascara_filtros(indice, tipos_promocao=["Sem Promo"])
+    np.testing.assert_array_equal(mask, vendas["promotion_type"].isna().to_numpy())
+
+
+def test_periodo_inclui_o_dia_final(vendas, indice):
+    mask = t.mascara_filtros(indice, data_inicio="2023-12-31", data_fim="2024-01-02")
+    esperado = (vendas["date"] >= "2023-12-31") & (vendas["date"] <= "2024-01-02")
+    np.testing.assert_array_equal(mask, esperado.to_numpy())
+
+
+def test_valor_inexistente(indice):
+    mask = t.mascara_filtros(indice, produtos=["Z"])
+    assert mask.dtype == bool and not mask.any()
@@ -0,0 +1,70 @@
+import pytest
+
+import analytics as t
+from metric_query import consultar_metricas
+
+
+def test_volume_por_produto_ordenado(vendas):
+    out = consultar_metricas(vendas, dimensoes=["product_id"], medidas=["volume"])
+    assert out["product_id"].tolist() == ["A", "C", "B"]
+    assert out["volume"].tolist() == [30.0, 7.0, 5.0]
+
+
+def test_medidas_sem_dimensao(vendas):
+    out = consultar_metricas(vendas, medidas=["receita", "gap", "linhas"])
+    assert list(out.columns) == ["receita", "gap", "linhas"]
+    assert out.loc[0, "receita"] == pytest.approx(82.0)
+    assert out.loc[0, "gap"] == pytest.approx(-3.0)
+    assert out.loc[0, "linhas"] == 5
+
+
+def test_mape_so_com_planejado_positivo(vendas):
+    # linhas com plano > 0: 2/8, 0, 5/10, 0 -> média 18.75% (a linha com plano 0 fica fora)
+    out = consultar_metricas(vendas, medidas=["mape"])
+    assert out.loc[0, "mape"] == pytest.approx(18.75)
+
+
+def test_promo_flag_e_mes_formatados(vendas):
+    out = consultar_metricas(vendas, dimensoes=["promo_flag"], medidas=["volume"])
+    assert dict(zip(out["promo_flag"], out["volume"])) == {"Sem Promo": 32.0, "Com Promo": 10.0}
+
+    out = consultar_metricas(vendas, dimensoes=["mes"], medidas=["volume"], ordenar_por="mes", ascendente=True)
+    assert out["mes"].tolist() == ["2023-12", "2024-01"]  # meses de anos diferentes não se somam
+    assert out["volume"].tolist() == [30.0, 12.0]
+
+
+def test_filtros_e_periodo(vendas):
+    out = consultar_metricas(vendas, medidas=["volume"], locais=["L1"])
+    assert out.loc[0, "volume"] == 22.0
+
+    out = consultar_metricas(vendas, medidas=["volume"], tipos_promocao=["Sem Promo"], produtos="A")
+    assert out.loc[0, "volume"] == 20.0
+
+    # data_fim inclui o dia inteiro, como nas demais tools
+    out = consultar_metricas(vendas, medidas=["volume"], data_inicio="2023-12-31", data_fim="2024-01-01")
+    assert out.loc[0, "volume"] == 25.0
+
+
+def test_filtros_com_indice_compartilhado(vendas):
+    indice = t.construir_indice_filtros(vendas)
+    out = consultar_metricas(vendas, dimensoes=["product_id"], medidas=["volume"], locais=["L2"], indice=indice)
+    assert dict(zip(out["product_id"], out["volume"])) == {"A": 20.0, "B": 0.0}
+
+
+def test_top_k(vendas):
+    out = consultar_metricas(vendas, dimensoes=["product_id"], medidas=["volume"], top_k=1)
+    assert out["product_id"].tolist() == ["A"]
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"dimensoes": ["regiao"]},
+        {"medidas": ["lucro"]},
+        {"data_inicio": "2024-13-45"},
+        {"dimensoes": ["local"], "medidas": ["volume"], "ordenar_por": "receita"},
+    ],
+)
+def test_especificacao_invalida(vendas, kwargs):
+    with pytest.raises(ValueError):
+        consultar_metricas(vendas, **kwargs)
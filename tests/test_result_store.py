@@ -0,0 +1,107 @@
+import pandas as pd
+import pytest
+
+import result_store as rs
+from result_store import ResultStore
+from sessao import SESSAO_ATUAL, definir_sessao
+
+
+@pytest.fixture
+def sessao():
+    """Troca a sessão atual dentro do teste e restaura a anterior no fim."""
+    tokens = []
+
+    def _usar(nome: str):
+        tokens.append(definir_sessao(nome))
+
+    yield _usar
+    for token in reversed(tokens):
+        SESSAO_ATUAL.reset(token)
+
+
+def _frame(linhas: int = 100) -> pd.DataFrame:
+    return pd.DataFrame({"x": range(linhas)})
+
+
+def _tamanho(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+
+def test_max_itens_descarta_o_menos_usado(sessao):
+    sessao("s1")
+    store = ResultStore(limite_bytes=10**9, max_itens=2)
+    r1 = store.salvar(_frame())
+    r2 = store.salvar(_frame())
+    store.obter(r1)  # r1 passa a ser o mais recente
+    r3 = store.salvar(_frame())
+
+    ids = [i["resultado_id"] for i in store.listar()]
+    assert ids == [r1, r3]
+    with pytest.raises(KeyError):
+        store.obter(r2)
+
+
+def test_limite_de_bytes_descarta_os_antigos(sessao):
+    sessao("s1")
+    df = _frame()
+    store = ResultStore(limite_bytes=2 * _tamanho(df), max_itens=10)
+    store.salvar(df)
+    r2 = store.salvar(df)
+    r3 = store.salvar(df)
+
+    assert [i["resultado_id"] for i in store.listar()] == [r2, r3]
+    assert store.total_bytes <= store.limite_bytes
+
+
+def test_resultado_maior_que_o_limite_nao_e_guardado(sessao):
+    sessao("s1")
+    df = _frame()
+    store = ResultStore(limite_bytes=_tamanho(df), max_itens=10, limite_total_bytes=10**9)
+    r1 = store.salvar(df)
+
+    assert store.salvar(_frame(1000)) is None
+    assert [i["resultado_id"] for i in store.listar()] == [r1]  # os anteriores continuam
+    assert store.total_bytes <= store.limite_bytes
+
+    global_pequeno = ResultStore(limite_bytes=10**9, max_itens=10, limite_total_bytes=_tamanho(df))
+    assert global_pequeno.salvar(_frame(1000)) is None
+    assert global_pequeno.total_bytes == 0
+
+
+def test_renderizar_sem_id_quando_nao_cabe(sessao, monkeypatch):
+    sessao("s1")
+    monkeypatch.setattr(rs, "store", ResultStore(limite_bytes=1, max_itens=10))
+    texto = rs.renderizar(_frame(), "grande", n=5)
+
+    assert "resultado_id" in texto and "sem resultado_id" in texto
+    assert "resultado_id=" not in texto
+
+
+def test_limite_global_entre_sessoes(sessao):
+    df = _frame()
+    store = ResultStore(limite_bytes=10**9, max_itens=10, limite_total_bytes=2 * _tamanho(df))
+    sessao("s1")
+    r1 = store.salvar(df)
+    sessao("s2")
+    store.salvar(df)
+    store.salvar(df)
+
+    assert store.total_bytes == 2 * _tamanho(df)
+    sessao("s1")
+    assert store.listar() == []  # a sessão que esvaziou foi removida
+    with pytest.raises(KeyError):
+        store.obter(r1)
+
+
+def test_resultados_isolados_por_sessao_e_limpeza(sessao):
+    store = ResultStore(limite_bytes=10**9, max_itens=10)
+    sessao("s1")
+    r1 = store.salvar(_frame())
+    sessao("s2")
+    with pytest.raises(KeyError):
+        store.obter(r1)
+
+    sessao("s1")
+    store.limpar_sessao()
+    assert store.listar() == []
+    assert store.total_bytes == 0
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import tool_memory as tm
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def orcamento(monkeypatch):
+    """Orçamento de 1 MB, fator de pico 1 e política padrão (amostrar)."""
+    monkeypatch.setattr(tm, "ORCAMENTO_BYTES", 1 * MB)
+    monkeypatch.setattr(tm, "FATOR_PICO", 1.0)
+    monkeypatch.setattr(tm, "POLITICA", "amostrar")
+    monkeypatch.setattr(tm, "PERFIL_HABILITADO", False)
+
+
+def _tool(linhas: int, bytes_linha: float = 100.0):
+    """Tool de teste: devolve a fração que o orçamento permitiu."""
+    def fn():
+        return {"fracao": tm.limitar_linhas(linhas, bytes_linha)}
+    return fn
+
+
+def test_fora_de_tool_nao_limita(orcamento):
+    assert tm.limitar_linhas(10**9, 100.0) is None
+
+
+def test_dentro_do_orcamento(orcamento):
+    assert tm.medir("t", _tool(1000)) == {"fracao": None}
+
+
+def test_sem_orcamento_nao_limita(monkeypatch):
+    monkeypatch.setattr(tm, "ORCAMENTO_BYTES", 0.0)
+    assert tm.medir("t", _tool(10**9)) == {"fracao": None}
+
+
+def test_tool_nao_amostravel_e_rejeitada(orcamento):
+    resultado = tm.medir("t", _tool(100_000))  # 10 MB previstos
+    assert isinstance(resultado, str) and resultado.startswith("Erro: chamada rejeitada")
+    assert tm.historico[-1]["rejeitada"]
+
+
+def test_tool_amostravel_roda_sobre_amostra(orcamento):
+    resultado = tm.medir("t", _tool(100_000), amostravel=True)
+    assert resultado["fracao"] == pytest.approx(MB / (100_000 * 100.0))
+    assert "amostra" in resultado["aviso_memoria"]
+
+
+def test_derivado_nunca_e_amostrado(orcamento):
+    def fn():
+        return tm.limitar_linhas(100_000, 100.0, amostravel=False)
+
+    resultado = tm.medir("t", fn, amostravel=True)
+    assert resultado.startswith("Erro: chamada rejeitada")
+
+
+def test_politica_rejeitar(orcamento, monkeypatch):
+    monkeypatch.setattr(tm, "POLITICA", "rejeitar")
+    resultado = tm.medir("t", _tool(100_000), amostravel=True)
+    assert resultado.startswith("Erro: chamada rejeitada")
+
+
+def test_amostrar_sem_reposicao_e_em_ordem():
+    linhas = np.arange(1000)
+    amostra = tm.amostrar(linhas, 0.1)
+    assert len(amostra) == 100
+    assert len(np.unique(amostra)) == 100
+    assert np.all(np.diff(amostra) > 0)